@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+
+"""
+Parser benchmarks for md2workflow.markdown
+
+Usage: python benchmarks/bench_markdown.py [number_of_lines]
+"""
+
+import codecs
+import io
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# for development
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+import md2workflow.markdown as markdown
+
+DEFAULT_LINES = 100000
+DEFAULT_CODE_BLOCK_LINES = 50000
+# Short paragraph used as a previous node while classifying
+PARAGRAPH = markdown.Paragraph("text")
+
+
+def generate_document(lines=DEFAULT_LINES):
+    """
+    Args:
+        lines (int) - approximate number of lines of the generated document
+
+    Returns a str with a checklist-like MarkDown document
+    """
+    result = []
+    i = 0
+    while len(result) < lines:
+        result.extend([
+            "# Epic %d" % i,
+            "",
+            "#### Task %d" % i,
+            "Responsible: qa",
+            "Depends on: Task %d" % (i - 1),
+            "",
+            "Please do the thing for ${Project} ${Epic}",
+            "Note: this looks like a variable but it is a part of the paragraph",
+            "",
+            "##### Subtask %d" % i,
+            "Subtask description",
+        ])
+        i += 1
+    return "\n".join(result[:lines])
+
+
+def generate_code_block(lines=DEFAULT_CODE_BLOCK_LINES):
+    """
+    Args:
+        lines (int) - number of lines inside of the code block
+
+    Returns a str with a single task containing one long fenced code block
+    Lines inside of the block look like headings and variables.
+    """
+    result = ["# Epic", "#### Task with a long code block", "Description", "```"]
+    for i in range(lines):
+        result.append("#### not a heading %d" % i if i % 2 else "not_a_variable: %d" % i)
+    result.append("```")
+    result.append("#### Task after the code block")
+    return "\n".join(result)
+
+
+def timeit(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+LEGACY_VARIABLE_PATTERN = r'^([a-zA-z_0-9 ]+)\s*:\s*(.*)'
+
+
+def legacy_is_heading(data, previous_node=None):
+    if isinstance(previous_node, markdown.Paragraph) and previous_node.text.count("```") % 2:
+        return 0
+    i = 0
+    while i <= len(data) - 1 and data[i] == "#":
+        i += 1
+    if i > 6:
+        i = 0
+    if i not in (1, 4, 5):
+        return 0
+    return i
+
+
+def legacy_is_variable(data, previous_node=None):
+    if re.search(LEGACY_VARIABLE_PATTERN, data):
+        if previous_node and legacy_is_paragraph(previous_node):
+            return False
+        return True
+    return False
+
+
+def legacy_is_paragraph(data, previous_node=None):
+    if isinstance(data, markdown.Paragraph):
+        return True
+    if isinstance(data, markdown.MarkDownObject):
+        return False
+    return not legacy_is_heading(data, previous_node) and not legacy_is_variable(data, previous_node)
+
+
+def legacy_classify(lines):
+    """
+    Classification as done before LineTokenizer was introduced.
+    Every line was tested by is_heading, is_variable and is_paragraph,
+    where is_paragraph called both of them again.
+    """
+    head = None
+    for line in lines:
+        if legacy_is_heading(line, head):
+            head = None
+        elif legacy_is_variable(line, head):
+            head = None
+        elif legacy_is_paragraph(line, head):
+            head = PARAGRAPH
+
+
+def tokenizer_classify(lines):
+    tokenizer = markdown.LineTokenizer()
+    head = None
+    for line in lines:
+        token = tokenizer.tokenize(line, head)
+        head = PARAGRAPH if token.kind == markdown.Token.PARAGRAPH else None
+
+
+def legacy_readlines(path):
+    """
+    File ingest as done by backends before. codecs.open() and a readline loop
+    """
+    fd = codecs.open(path, encoding="utf-8")
+    lines = []
+    while 1:
+        line = fd.readline()
+        if not line:
+            break
+        lines.append(line)
+    fd.close()
+    return lines
+
+
+def bulk_readlines(path):
+    with open(path, "rb") as fd:
+        return fd.read().decode("utf-8").splitlines(True)
+
+
+def parse_legacy_file(path):
+    md = markdown.MarkDown()
+    md.read(codecs.open(path, encoding="utf-8"))
+
+
+def parse_path(path):
+    md = markdown.MarkDown()
+    md.read_path(path)
+
+
+def iterparse_file(path):
+    md = markdown.MarkDown()
+    for event in md.iterparse(markdown.MarkDown.open_file(path)):
+        pass
+
+
+def bench_file_ingest(text):
+    fd, path = tempfile.mkstemp(suffix=".md")
+    with os.fdopen(fd, "w") as f:
+        f.write(text)
+    try:
+        size = os.path.getsize(path) / 1024.0 / 1024.0
+        legacy = timeit(legacy_readlines, path)
+        bulk = timeit(bulk_readlines, path)
+        print("ingest %.1f MiB: codecs.open readline loop %.3fs, bulk read %.3fs (%.1fx)" % (
+            size, legacy, bulk, legacy / bulk))
+        print("parse %.1f MiB: read(codecs.open) %.3fs, read_path %.3fs, iterparse(open_file) %.3fs" % (
+            size, timeit(parse_legacy_file, path), timeit(parse_path, path), timeit(iterparse_file, path)))
+    finally:
+        os.remove(path)
+
+
+def bench_persistent_cache(text):
+    """
+    Compares a cold run (parse and store) with a warm run (load from the on-disk cache)
+    """
+    tmpdir = tempfile.mkdtemp()
+    path = os.path.join(tmpdir, "document.md")
+    with open(path, "w") as f:
+        f.write(text)
+    cache_dir = os.path.join(tmpdir, "cache")
+    try:
+        uncached = timeit(markdown.MarkDownCache().parse, path)
+        cold = timeit(markdown.MarkDownCache(cache_dir=cache_dir).parse, path)
+        warm = timeit(markdown.MarkDownCache(cache_dir=cache_dir).parse, path)
+        print("persistent cache: no cache %.3fs, cold run %.3fs, warm run %.3fs (%.1fx)" % (
+            uncached, cold, warm, uncached / warm))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def count_nodes(node):
+    return sum(1 for event, child in node.iterevents() if event == markdown.EVENT_START)
+
+
+def bench_memory(text):
+    """
+    Reports memory allocated by the parsed tree per 100k nodes
+    """
+    tracemalloc.start()
+    md = markdown.MarkDown()
+    md.reads(text)
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    nodes = count_nodes(md)
+    print("memory: %d nodes, %.1f MiB per 100k nodes" % (
+        nodes, allocated * 100000.0 / nodes / 1024 / 1024))
+
+
+def parse(text):
+    md = markdown.MarkDown()
+    md.reads(text)
+
+
+def render(text):
+    md = markdown.MarkDown()
+    md.reads(text)
+    out = io.StringIO()
+    return timeit(md.write_markdown, out)
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_LINES
+    text = generate_document(lines)
+    split = text.splitlines()
+
+    legacy = timeit(legacy_classify, split)
+    tokenized = timeit(tokenizer_classify, split)
+    print("classify %d lines: is_heading/is_variable/is_paragraph %.3fs, LineTokenizer %.3fs (%.1fx)" % (
+        len(split), legacy, tokenized, legacy / tokenized))
+    print("parse %d lines: MarkDown.reads %.3fs" % (len(split), timeit(parse, text)))
+    print("render %d lines: write_markdown %.3fs" % (len(split), render(text)))
+
+    bench_file_ingest(text)
+    bench_memory(text)
+    bench_persistent_cache(text)
+
+    # Regression: parse time has to stay linear with the length of a paragraph
+    for block_lines in (DEFAULT_CODE_BLOCK_LINES // 4, DEFAULT_CODE_BLOCK_LINES):
+        print("parse %d line code block: MarkDown.reads %.3fs" % (
+            block_lines, timeit(parse, generate_code_block(block_lines))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+"""
+Model building benchmarks for md2workflow.workflow
+
+Usage: python benchmarks/bench_workflow.py [number_of_workflows] [tasks_per_workflow]
+"""
+
+import configparser
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+# for development
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+import md2workflow.markdown as markdown
+import md2workflow.workflow as workflow
+
+DEFAULT_WORKFLOWS = 50
+DEFAULT_TASKS = 100
+
+ENVIRONMENT = u"""
+[TaskRelations]
+relations = Blocks, Depends On, Implements, Implemented by
+inbound = Implemented by, Depends On
+"""
+
+PROJECT_CONF = u"""
+[project]
+name = Benchmark product
+"""
+
+
+def generate_workflow(tasks=DEFAULT_TASKS, prefix="Task"):
+    """
+    Args:
+        tasks (int) - number of tasks in the workflow
+        prefix="Task" (str) - prefix of task summaries
+
+    Returns a str with a workflow where every task depends on the previous one
+    and blocks the next one (a forward reference).
+    """
+    result = []
+    for i in range(tasks):
+        result.append("#### %s %d" % (prefix, i))
+        result.append("Responsible: qa")
+        if i:
+            result.append("Depends on: %s %d" % (prefix, i - 1))
+        if i < tasks - 1:
+            result.append("Blocks: %s %d" % (prefix, i + 1))
+        result.append("")
+        result.append("Description of task %d" % i)
+    return "\n".join(result)
+
+
+def timeit(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def new_project():
+    environment = configparser.ConfigParser()
+    environment.read_string(ENVIRONMENT)
+    conf = configparser.ConfigParser()
+    conf.read_string(PROJECT_CONF)
+    project = workflow.GenericProject("Benchmark product", environment=environment, conf=conf)
+    project.logger.setLevel(logging.ERROR)
+    return project
+
+
+def parse(text):
+    md = markdown.MarkDown()
+    md.reads(text)
+    return md
+
+
+def build(project, documents):
+    for i, md in enumerate(documents):
+        project.from_markdown(md, override_workflow_name="Milestone %d" % i)
+    project.publish_task_relations()
+
+
+def main():
+    workflows = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_WORKFLOWS
+    tasks = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_TASKS
+    # The same document used by all workflows (e.g. repetitive tasks for milestones)
+    md = parse(generate_workflow(tasks))
+    for count in (workflows // 2, workflows):
+        print("build %d workflows x %d tasks, shared summaries: %.3fs" % (
+            count, tasks, timeit(build, new_project(), [md] * count)))
+
+    tracemalloc.start()
+    project = new_project()
+    build(project, [md] * workflows)
+    print("memory of %d workflows x %d tasks, shared summaries: %.1f MiB" % (
+        workflows, tasks, tracemalloc.get_traced_memory()[0] / 1024.0 / 1024))
+    tracemalloc.stop()
+    del project
+
+    # Every workflow has its own tasks
+    documents = [parse(generate_workflow(tasks, "Task %d" % i)) for i in range(workflows)]
+    for count in (workflows // 2, workflows):
+        print("build %d workflows x %d tasks, unique summaries: %.3fs" % (
+            count, tasks, timeit(build, new_project(), documents[:count])))
+
+    # A single large workflow, relations of one workflow are checked for duplicates
+    for count in (workflows // 2, workflows):
+        md = parse(generate_workflow(tasks * count))
+        print("build 1 workflow x %d tasks: %.3fs" % (
+            tasks * count, timeit(build, new_project(), [md])))
+
+    # Relation graph of the whole project
+    project = new_project()
+    build(project, documents)
+    graph = project.relation_graph()
+    print("relation graph %d tasks, %d relations: build %.3fs, waves %.3fs, transitive reduction %.3fs" % (
+        len(graph), len(graph.edges), timeit(project.relation_graph), timeit(graph.waves),
+        timeit(graph.redundant_edges)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,10 @@
 # -*- coding: utf-8 -*-
 
-import codecs
 import os
 import getpass
 import sys
 
 import md2workflow.workflow as workflow
-import md2workflow.markdown as markdown
 import md2workflow.schedule as schedule
 
 from md2workflow.cli import get_md_abspath
@@ -51,11 +49,10 @@ def handle_project(cli):
                     project_relpath, md_path))
                 sys.exit(3)
 
-            fd = codecs.open(md_path, encoding='utf-8')
-            md = markdown.MarkDown()
-            md.logger = cli.logger
-            md.read(fd)
+            md = cli.markdown_cache.parse(md_path, heading_levels=project.heading_levels)
             project.from_markdown(md, override_workflow_name=workflow_section)
             project.relations_from_conf_section(project.conf, workflow_section)
 
+    # all sections are loaded, link them at once
+    project.publish_task_relations()
     return True  # for testing purposes
@@ -1,10 +1,15 @@
 # -*- coding: utf-8 -*-
 
-import codecs
 import os
 import getpass
+import hashlib
+import logging
 import re
 import sys
+import threading
+import time
+
+from concurrent import futures
 
 import jira  # python-jira, also the only reason why this file is called jirabackend.py
 try:
@@ -12,16 +17,29 @@ try:
 except ImportError:
     import json
 import md2workflow.workflow as workflow
-import md2workflow.markdown as markdown
 import md2workflow.schedule as schedule
+import md2workflow.template as template
 
 from md2workflow.cli import get_md_abspath
+from md2workflow.relations import RelationSchema
 from configparser import ConfigParser
 
 from md2workflow.cli import CliAction, EXAMPLE_DIR
 
-# cache to optmize behavior, as it's expected to be called 100+ times
-GLOBAL_ALL_FIELDS = []
+MARKDOWN_BOLD_RE = re.compile(r"\*\*|__")
+
+# number of issues per search_issues() call while prefetching issues for --update
+PREFETCH_PAGE_SIZE = 100
+# number of issues per create_issues() call, [jira] create_batch_size
+DEFAULT_CREATE_BATCH_SIZE = 50
+# number of concurrent requests, [jira] max_workers
+DEFAULT_MAX_WORKERS = 1
+# maximum number of issues per add_issues_to_epic() call accepted by jira agile api
+EPIC_BATCH_SIZE = 50
+# seconds for which fields of a server are reused from the cache, [cache] jira_fields_ttl is in hours
+DEFAULT_FIELDS_TTL = 24 * 60 * 60
+# system field ids which are not returned by fields(), used as they are
+SYSTEM_FIELD_IDS = frozenset(["parent"])
 
 
 def substitute_links(text, topurl=None):
@@ -55,7 +73,260 @@ def substitute_links(text, topurl=None):
     return substituted_text
 
 
+def markdown_to_jira(text, context):
+    """
+    Args:
+        text (str): rendered description
+        context (dict): relative_link_topurl is used for links, see substitute_links()
+
+    Returns text with links and bold converted to JIRA markup
+    """
+    if context.get("relative_link_topurl"):
+        text = substitute_links(text, topurl=context["relative_link_topurl"])
+
+    #text = text.replace(">", "&gt;")
+    #text = text.replace("<", "&lt;")
+
+    # Markdown bold (** or __) to JIRA bold
+    return MARKDOWN_BOLD_RE.sub("*", text)
+
+
+class JiraPublisher(object):
+    """
+    Runs jira requests on a bounded thread pool.
+    Results are returned in order of the items, so the outcome doesn't depend
+    on the order in which requests finish.
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS):
+        """
+        Args:
+            max_workers=DEFAULT_MAX_WORKERS (int) - 1 runs everything in the calling thread
+        """
+        self.max_workers = max(max_workers, 1)
+        self._executor = None
+
+    def map(self, func, items):
+        """
+        Args:
+            func (callable) - called with each item
+            items (iterable)
+
+        Returns list of results of func in order of items.
+        The first exception raised by func is re-raised once all calls finished.
+        """
+        items = list(items)
+        if self.max_workers == 1 or len(items) < 2:
+            return [func(item) for item in items]
+        if self._executor is None:
+            self._executor = futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        calls = [self._executor.submit(func, item) for item in items]
+        futures.wait(calls)
+        return [call.result() for call in calls]
+
+    def shutdown(self):
+        if self._executor:
+            self._executor.shutdown()
+            self._executor = None
+
+
+class JiraFieldRegistry(object):
+    """
+    Result of jira_session.fields() indexed by field name and field id, one registry per server.
+    Field names and ids are looked up in a dict instead of scanning all fields of the server.
+
+    If cache_dir is set, fields are stored there and reused by following runs for ttl seconds,
+    so jira_session.fields() is not called at all. Fields are fetched again from the server
+    (at most once per run) if a field name is not known, e.g. a custom field was added meanwhile.
+    Names which are not known even after that are stored as well, so they don't cause
+    a fetch in following runs until the stored fields expire.
+    """
+    _registries = {}  # server -> JiraFieldRegistry
+    _registries_lock = threading.Lock()
+
+    def __init__(self, server=None, logger=None, cache_dir=None, ttl=DEFAULT_FIELDS_TTL):
+        """
+        Args:
+            server=None (str) - url of the jira server, the cache file is named after it
+            logger=None (Logger)
+            cache_dir=None (str) - directory for persistent fields, nothing is stored if None
+            ttl=DEFAULT_FIELDS_TTL (int) - seconds after which the stored fields are fetched again
+        """
+        self.server = server
+        self.logger = logger or logging
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self._fields = None  # [{"id": id, "name": name}] as stored in cache_dir
+        self._ids = None  # field name or field id -> field id
+        self._missing = set()  # names which are not fields of the server
+        self._fetched = None  # time when fields were fetched from the server
+        self._fetched_now = False  # fields were fetched from the server during this run
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls, server):
+        """
+        Args:
+            server (str) - url of the jira server
+
+        Returns JiraFieldRegistry of the server, shared by all tasks
+        """
+        with cls._registries_lock:
+            registry = cls._registries.get(server)
+            if registry is None:
+                registry = cls._registries[server] = cls(server)
+            return registry
+
+    @property
+    def cache_path(self):
+        return os.path.join(self.cache_dir, "jira-fields-%s.json" % hashlib.sha1(
+            (u"%s" % self.server).encode("utf-8")).hexdigest())
+
+    def field_id(self, session, field_name):
+        """
+        Args:
+            session (jira.JIRA) - used only if fields are not known yet or field_name is unknown
+            field_name (str) - name or id of a field e.g. Epic Link
+
+        Returns id of the field e.g. customfield_10006 or None if there is no such field
+        """
+        field_name = u"%s" % field_name
+        if field_name in SYSTEM_FIELD_IDS:
+            return field_name
+        ids = self._ids
+        if ids is not None and field_name in ids:
+            return ids[field_name]
+
+        with self._lock:
+            if self._ids is None and not self.load():
+                self.fetch(session)
+            if field_name in self._ids or field_name in self._missing:
+                return self._ids.get(field_name)
+            if not self._fetched_now:
+                self.logger.debug("Field '%s' is not known, refreshing fields of %s" % (
+                    field_name, self.server))
+                self.fetch(session)
+            if field_name not in self._ids:
+                self._missing.add(field_name)
+                self.store()
+            return self._ids.get(field_name)
+
+    def index(self, fields):
+        """
+        Args:
+            fields (list) - dicts with name and id as returned by jira_session.fields()
+        """
+        self._fields = [{"id": u"%s" % field[u"id"], "name": u"%s" % field[u"name"]} for field in fields]
+        ids = {}
+        # the first field matching by name or id wins
+        for field in self._fields:
+            ids.setdefault(field["name"], field["id"])
+            ids.setdefault(field["id"], field["id"])
+        self._ids = ids
+
+    def fetch(self, session):
+        """
+        Fetches fields from the server and stores them in cache_dir
+        """
+        self.index(session.fields())
+        self._missing = set()
+        self._fetched = time.time()
+        self._fetched_now = True
+        self.store()
+
+    def load(self):
+        """
+        Returns True if fields were restored from cache_dir and are not older than ttl
+        """
+        if not self.cache_dir:
+            return False
+        try:
+            with open(self.cache_path) as fd:
+                data = json.load(fd)
+        except (IOError, OSError):
+            return False
+        except ValueError:
+            self.logger.warning("Ignoring corrupted fields cache %s" % self.cache_path)
+            return False
+
+        if data.get("server") != self.server or time.time() - data.get("fetched", 0) > self.ttl:
+            return False
+        self.logger.debug("Using cached fields of %s from %s" % (self.server, self.cache_path))
+        self.index(data["fields"])
+        self._missing = set(data.get("missing", []))
+        self._fetched = data["fetched"]
+        return True
+
+    def store(self):
+        """
+        Stores fields in cache_dir. Failures are not fatal, fields are just fetched next time.
+        """
+        if not self.cache_dir:
+            return
+        cache_path = self.cache_path
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            # write + rename so that concurrent runs never see a partial file
+            tmp_path = "%s.%d.tmp" % (cache_path, os.getpid())
+            with open(tmp_path, "w") as fd:
+                json.dump({"server": self.server, "fetched": self._fetched, "fields": self._fields,
+                           "missing": sorted(self._missing)}, fd)
+            os.rename(tmp_path, cache_path)
+        except (IOError, OSError) as e:
+            self.logger.warning("Could not store fields cache %s: %s" % (cache_path, e))
+
+
+class JiraIssueIndex(object):
+    """
+    Existing issues of a project indexed by (issue type, epic key, parent key, exact summary).
+    Built once by JiraBasedProject.prefetch_issues() so that fetch_myself() of each task
+    doesn't need to search jira.
+    """
+
+    def __init__(self, epic_link_field=None):
+        """
+        Args:
+            epic_link_field=None (str) - field id with the epic key e.g. customfield_12345
+        """
+        self.epic_link_field = epic_link_field
+        self._issues = {}  # key -> [issue]
+
+    def issue_key(self, issue):
+        """
+        Returns index key of a jira issue
+        """
+        fields = issue.fields
+        epic = getattr(fields, self.epic_link_field, None) if self.epic_link_field else None
+        parent = getattr(fields, "parent", None)
+        return (u"%s" % fields.issuetype.name, u"%s" % epic if epic else None,
+                u"%s" % parent.key if parent else None, u"%s" % fields.summary)
+
+    def add(self, issue):
+        key = self.issue_key(issue)
+        if key not in self._issues:
+            self._issues[key] = []
+        self._issues[key].append(issue)
+
+    def find(self, issue_type, epic, parent, summary):
+        """
+        Args:
+            issue_type (str) - e.g. Task
+            epic (str) - key of the epic or None
+            parent (str) - key of the parent issue (for Sub-Tasks) or None
+            summary (str) - exact summary
+
+        Returns list of matching issues
+        """
+        return self._issues.get((u"%s" % issue_type, epic, parent, u"%s" % summary), [])
+
+    def __len__(self):
+        return sum(len(issues) for issues in self._issues.values())
+
+
 class JiraSubTask(workflow.GenericTask):
+    _field_registry = None  # JiraFieldRegistry, see field_registry
+
     def __init__(self, summary, jira_session=None, description="", environment=None, conf=None):
         super(JiraSubTask, self).__init__(
             summary, description, environment, conf)
@@ -105,18 +376,34 @@ class JiraSubTask(workflow.GenericTask):
                 "%s: unsupported action %s" % (self.__class__.__name__, action))
         self.action = action
 
+    @property
+    def field_registry(self):
+        """
+        Returns JiraFieldRegistry of the task or its project (see field_registry_from_cli()),
+        registry of [jira] server shared by all tasks without one otherwise
+        """
+        if self._field_registry is not None:
+            return self._field_registry
+        project = self.ancestor("project")
+        if project is not None and project._field_registry is not None:
+            return project._field_registry
+
+        server = None
+        if self.environment and self.environment.has_section("jira"):
+            server = self.environment["jira"].get("server")
+        return JiraFieldRegistry.get(server)
+
+    @field_registry.setter
+    def field_registry(self, value):
+        self._field_registry = value
+
     def _get_field(self, field_name):
         field_name = u"%s" % field_name
         self.logger.debug("Getting field id for '%s'" % field_name)
-        global GLOBAL_ALL_FIELDS
-        if not GLOBAL_ALL_FIELDS:
-            GLOBAL_ALL_FIELDS = self.jira_session.fields()
-
-        for field in GLOBAL_ALL_FIELDS:
-            if field[u"name"] == field_name or field[u"id"] == field_name:
-                self.logger.debug("Found %s for field '%s'" %
-                                  (field[u"id"], field_name))
-                return field[u"id"]
+        field_id = self.field_registry.field_id(self.jira_session, field_name)
+        if field_id is not None:
+            self.logger.debug("Found %s for field '%s'" % (field_id, field_name))
+            return field_id
 
         self.logger.debug(
             "Couldn't find field with id or name '%s' in fields(), using field_name itself." % field_name)
@@ -124,31 +411,11 @@ class JiraSubTask(workflow.GenericTask):
 
     @property
     def description(self):
-        res = self._description.strip()
-
-        # Subsitute both Product and Project with the project name
-        if self.conf and "project" in self.conf:
-            res = res.replace("${Project}", self.conf["project"]["name"])
-            res = res.replace("${Product}", self.conf["project"]["name"])
-
-        if self.parent_by_subclass(JiraBasedWorkflow):
-            # Substitute both Epic and Miestone with the Epic name
-            res = res.replace("${Epic}", str(self.parent_by_subclass(
-                JiraBasedWorkflow).summary))  # XXX will not work for subtask
-            res = res.replace("${Milestone}", str(self.parent_by_subclass(
-                JiraBasedWorkflow).summary))  # XXX will not work for subtask
-
+        context = template.project_context(self.conf, self.parent_by_subclass(JiraBasedWorkflow))
         if self.environment and "jira" in self.environment and \
             self.environment["jira"].get("relative_link_topurl", None):
-            res = substitute_links(
-                res, topurl=self.environment["jira"]['relative_link_topurl'])
-
-        #res = res.replace(">", "&gt;")
-        #res = res.replace("<", "&lt;")
-
-        res = res.replace("**", "*") # Markdown bold to JIRA bold
-        res = res.replace("__", "*") # Markdown bold to JIRA bold
-        return res
+            context["relative_link_topurl"] = self.environment["jira"]['relative_link_topurl']
+        return self.render_description(context, markdown_to_jira)
 
     @description.setter
     def description(self, value):
@@ -195,23 +462,19 @@ class JiraSubTask(workflow.GenericTask):
         return fields
 
     def _get_linktype(self, name):
-        name = name.lower()  # ini attr names are lowercase
-        assert u"%s" % name in [u"%s" % x.lower().strip(
-        ) for x in self.environment["TaskRelations"]["relations"].split(",")]
-
-        if name not in self.environment["JiraTaskRelations"]:
-            raise ValueError(
-                "Link type %s was not found in [JiraTaskRelations]")
-        return self.environment["JiraTaskRelations"][name]
-
-        return
+        return RelationSchema.get(self.environment).link_type(name)
 
     def publish(self, force_publish=False):
         if not self._published and not force_publish:
             "This callback signalizes that we're all set with setting all attributes. And that task is ready to be created"
             self.logger.debug("Publishing task '%s' description '%s'. All attrs were set. Task owner: %s" % (
                 u"%s" % self.summary, u"%s" % self.description[:20].strip(), u"%s" % self.owner))
-            self._jira_create_or_update()
+            project = self.ancestor("project")
+            if project is not None and project is not self:
+                # see JiraBasedProject.publish_queued_issues()
+                project.queue_issue(self)
+            else:
+                self._jira_create_or_update()
             self._published = True
 
     def fetch_myself(self, force=False):
@@ -230,6 +493,51 @@ class JiraSubTask(workflow.GenericTask):
         if self._issue and not force:
             return
 
+        if self.parent_task and type(self) == JiraSubTask and not self.parent_task._issue:
+            if self.action == CliAction.UPDATE:
+                self.logger.debug(
+                    "Parent doesn't have _issue. This can happen if Epic is DONE (not editable), and task changed summary and has new subtasks.")
+                return
+
+        project = self.ancestor("project")
+        if project is not None and project.issue_index is not None:
+            # prefetched issues of the whole project, not found means that the issue doesn't exist
+            query = "prefetched issues %s" % repr(self._issue_index_key())
+            result = project.issue_index.find(*self._issue_index_key())
+        else:
+            query = self._fetch_query()
+            # ~ doesn't do exact match
+            result = filter_result_by_summary(
+                self.jira_session.search_issues(query), self.summary)
+
+        if len(result) > 1:  # ~ doesn't do exact match
+            self.logger.error(
+                "Found more than 1 result with given EXACT summary, update failed. Query '%s'" % query)
+            raise ValueError(
+                "Found more than 1 result with given EXACT summary, update failed. Query '%s'" % query)
+
+        self.logger.debug("Query result %s" % str(result))
+        if result:
+            self._issue = result[0]
+        else:
+            self.logger.debug("Could not find issue '%s'" % self.summary)
+
+    def _issue_index_key(self):
+        """
+        Returns (issue type, epic key, parent key, summary) used to find the issue in JiraIssueIndex
+        """
+        epic = parent = None
+        if self.parent_task and type(self) == JiraTask and self.parent_task._issue:
+            epic = u"%s" % self.parent_task._issue.key
+        if self.parent_task and type(self) == JiraSubTask:
+            parent = u"%s" % self.parent_task._issue.key
+        return (self.environment["jira"]["mapping_%s" % self.__class__.__name__],
+                epic, parent, self.summary)
+
+    def _fetch_query(self):
+        """
+        Returns JQL query searching for the issue of the task
+        """
         # jira.search_issues('project=PROJ and assignee != currentUser()')
         query = 'project=%s AND summary ~ "%s"' % (
             self.environment["jira"]["project"], self.summary)
@@ -238,12 +546,6 @@ class JiraSubTask(workflow.GenericTask):
                 query, self.environment["jira"]['mapping_EpicNameQuery'], self.parent_task.summary)
 
         if self.parent_task and type(self) == JiraSubTask:
-            if not self.parent_task._issue:
-                if self.action == CliAction.UPDATE:
-                    self.logger.debug(
-                        "Parent doesn't have _issue. This can happen if Epic is DONE (not editable), and task changed summary and has new subtasks.")
-                    return
-
             self.logger.debug("fetch_myself: Sub task parent %s" %
                               self.parent_task)
             query = '%s AND parent = %s' % (query, self.parent_task._issue.key)
@@ -257,21 +559,7 @@ class JiraSubTask(workflow.GenericTask):
                 "mapping_ProjectName is unset. This may lead to unexpected results while updating existing jiras.")
         self.logger.debug(
             "Using following query to find and update task '%s'" % query)
-
-        # ~ doesn't do exact match
-        result = filter_result_by_summary(
-            self.jira_session.search_issues(query), self.summary)
-        if len(result) > 1:  # ~ doesn't do exact match
-            self.logger.error(
-                "Found more than 1 result with given EXACT summary, update failed. Query '%s'" % query)
-            raise ValueError(
-                "Found more than 1 result with given EXACT summary, update failed. Query '%s'" % query)
-
-        self.logger.debug("Query result %s" % str(result))
-        if result:
-            self._issue = result[0]
-        else:
-            self.logger.debug("Could not find issue '%s'" % self.summary)
+        return query
 
     @property
     def _jira_updatable_fields(self):
@@ -289,40 +577,113 @@ class JiraSubTask(workflow.GenericTask):
         return False
 
     def _jira_create_or_update(self):
+        if not self._jira_update():
+            return
+
+        # Either create new or not found
+        if not self._issue:
+            self.logger.debug("Issue fields %s" % self._jira_fields)
+            self._issue_created(self.jira_session.create_issue(
+                fields=self._jira_fields))
+        self._add_to_epic()
+
+    def _jira_update(self):
+        """
+        Updates existing issue of the task (if found) in update mode.
+        Returns False if the issue or its parent is not updatable and the task has to be skipped
+        """
+        if not self._jira_find_updatable():
+            return False
+        fields = self._jira_update_fields()
+        if fields is not None:
+            self._jira_update_issue(fields)
+        return True
+
+    def _jira_find_updatable(self):
+        """
+        Finds existing issue of the task in update mode.
+        Returns False if the issue or its parent is not updatable and the task has to be skipped
+        """
         if self.action == CliAction.UPDATE:
             self.parent_task.fetch_myself()
 
             if not self.is_updatable():
                 self.logger.info(
                     "Issue '%s' or it's parent is not updatable. Skipping" % self.summary)
-                return
+                return False
+        return True
 
-        # Either create new or not found
+    def _jira_update_fields(self):
+        """
+        Returns fields for update of the existing issue, None if there is no issue or it's up to date
+        """
         if not self._issue:
-            self.logger.debug("Issue fields %s" % self._jira_fields)
-            self._issue = self.jira_session.create_issue(
-                fields=self._jira_fields)
-            self.logger.info("Created issue %s - %s/browse/%s" %
-                             (self.summary, self.environment["jira"]["server"], self._issue.key))
-            self.logger.info("Assigning task %s to %s " %
-                             (self.summary, self.owner))
-        else:
-            if self._description_needs_update():
-                self.logger.info("Issue %s/browse/%s needs to be updated" %
-                                 (self.environment["jira"]["server"], self._issue.key))
-            # TODO ensure that we process only updatable fields
-                self._issue.update(fields=self._jira_updatable_fields)
-                self.logger.info("Updated issue %s/browse/%s" %
-                                 (self.environment["jira"]["server"], self._issue.key))
-            else:
-                self.logger.info("Issue %s/browse/%s is up to date. No update needed." %
-                                 (self.environment["jira"]["server"], self._issue.key))
+            return None
+        if not self._description_needs_update():
+            self.logger.info("Issue %s/browse/%s is up to date. No update needed." %
+                             (self.environment["jira"]["server"], self._issue.key))
+            return None
+        self.logger.info("Issue %s/browse/%s needs to be updated" %
+                         (self.environment["jira"]["server"], self._issue.key))
+        # TODO ensure that we process only updatable fields
+        return self._jira_updatable_fields
+
+    def _jira_update_issue(self, fields):
+        """
+        Args:
+            fields (dict) - see _jira_update_fields()
+        """
+        self._issue.update(fields=fields)
+        self.logger.info("Updated issue %s/browse/%s" %
+                         (self.environment["jira"]["server"], self._issue.key))
+
+    def _issue_created(self, issue):
+        """
+        Args:
+            issue (jira.Issue) - newly created issue of the task
+        """
+        self._issue = issue
+        # created by this run, bulk created issues don't even have fields with status
+        self._updatable = True
+        self.logger.info("Created issue %s - %s/browse/%s" %
+                         (self.summary, self.environment["jira"]["server"], self._issue.key))
+        self.logger.info("Assigning task %s to %s " %
+                         (self.summary, self.owner))
+
+    @property
+    def epic(self):
+        """
+        Returns JiraBasedWorkflow which is the Epic of the task or None
+        """
         # Doesn't really work with Project
         if self.parent_task and type(self.parent_task) == JiraBasedWorkflow:
-            self.jira_session.add_issues_to_epic(self.parent_task._issue.id, issue_keys=[
+            return self.parent_task
+        return None
+
+    def _has_epic_link(self, epic_link_field):
+        """
+        Args:
+            epic_link_field (str) - field id with the epic key e.g. customfield_12345
+
+        Returns True if the existing issue already belongs to the issue of its epic
+        """
+        epic = self.epic
+        fields = getattr(self._issue, "fields", None)
+        if not epic or not epic._issue or fields is None:
+            return False
+        return u"%s" % getattr(fields, epic_link_field, None) == u"%s" % epic._issue.key
+
+    def _add_to_epic(self):
+        epic = self.epic
+        if epic:
+            if not epic._issue:
+                self.logger.warning("Epic '%s' has no issue. Issue %s was not added to it" % (
+                    epic.summary, self._issue.key))
+                return
+            self.jira_session.add_issues_to_epic(epic._issue.id, issue_keys=[
                                                  self._issue.id, ], ignore_epics=True)
             self.logger.info("Added issue %s under epic %s" %
-                             (self._issue.key, self.parent_task._issue.key))
+                             (self._issue.key, epic._issue.key))
 
 
 class JiraTask(JiraSubTask, workflow.GenericNestedTask):
@@ -367,6 +728,12 @@ class JiraBasedWorkflow(JiraTask, workflow.GenericWorkflow):
     def task_class(self):
         return JiraTask
 
+    def _publish_resolved_task_relations(self, redundant=()):
+        # all issues exist at this point, links are independent of each other
+        project = self.ancestor("project")
+        publisher = project.publisher if project is not None else JiraPublisher()
+        publisher.map(self.publish_task_relation, list(self._relations_to_publish(redundant)))
+
     def publish_task_relation(self, relation):
         relation.source.fetch_myself()
         relation.target.fetch_myself()
@@ -376,15 +743,15 @@ class JiraBasedWorkflow(JiraTask, workflow.GenericWorkflow):
                 relation.source.fetch_myself()
                 relation.target.fetch_myself()
 
-            # Double check on update, perhaps fetch_myself returned None
-            if not relation.source._issue or not relation.target._issue:
-                self.logger.debug(
-                    "publish_task_relation source: %s" % relation.source._issue)
-                self.logger.debug(
-                    "publish_task_relation target: %s" % relation.target._issue)
-                self.logger.warning("SKIPPED creating of JIRA issue link '%s' %s '%s'  as one of _issues was None " %
-                                    (relation.source.summary, relation.relation_name, relation.target.summary))
-                return
+        # Double check, perhaps fetch_myself returned None or the issue failed to be created
+        if not relation.source._issue or not relation.target._issue:
+            self.logger.debug(
+                "publish_task_relation source: %s" % relation.source._issue)
+            self.logger.debug(
+                "publish_task_relation target: %s" % relation.target._issue)
+            self.logger.warning("SKIPPED creating of JIRA issue link '%s' %s '%s'  as one of _issues was None " %
+                                (relation.source.summary, relation.relation_name, relation.target.summary))
+            return
 
         self.logger.info("Creating JIRA issue link '%s' %s '%s'" % (
             relation.source.summary, relation.relation_name, relation.target.summary))
@@ -393,16 +760,209 @@ class JiraBasedWorkflow(JiraTask, workflow.GenericWorkflow):
 
 
 class JiraBasedProject(JiraBasedWorkflow, workflow.GenericProject):
+    issue_index = None  # JiraIssueIndex, see prefetch_issues()
+    _queued_issues = None  # level -> [task], see queue_issue()
+    _publisher = None
 
-    def publish_task_relations(self):
-        super(JiraBasedProject, self).publish_task_relations()
-        for task in self.tasks:
-            task._replace_task_placeholders()
-            task.publish_task_relations()  # publish individual workflows as well
+    @property
+    def create_batch_size(self):
+        """
+        Returns [jira] create_batch_size or DEFAULT_CREATE_BATCH_SIZE
+        """
+        if not self.environment.has_section("jira"):
+            return DEFAULT_CREATE_BATCH_SIZE
+        return self.environment["jira"].getint("create_batch_size", DEFAULT_CREATE_BATCH_SIZE)
+
+    @property
+    def publisher(self):
+        """
+        Returns JiraPublisher with [jira] max_workers (DEFAULT_MAX_WORKERS if unset)
+        """
+        if self._publisher is None:
+            max_workers = DEFAULT_MAX_WORKERS
+            if self.environment.has_section("jira"):
+                max_workers = self.environment["jira"].getint("max_workers", DEFAULT_MAX_WORKERS)
+            self._publisher = JiraPublisher(max_workers)
+        return self._publisher
+
+    def queue_issue(self, task):
+        """
+        Args:
+            task (JiraSubTask) - published task
+
+        Queues the task for publish_queued_issues(). Tasks are grouped by level
+        (Epic, Task, Sub-Task) as sub tasks need the issue of their parent.
+        """
+        if self._queued_issues is None:
+            self._queued_issues = {}
+        level = 0
+        head = task
+        while head.parent_task and head.parent_task is not self:
+            head = head.parent_task
+            level += 1
+        if level not in self._queued_issues:
+            self._queued_issues[level] = []
+        self._queued_issues[level].append(task)
+
+    def publish_queued_issues(self):
+        """
+        Creates or updates issues of queued tasks level by level, an Epic before its tasks
+        and a task before its sub tasks. Requests of the same level run on the publisher
+        (see [jira] max_workers), new issues are created in chunks of create_batch_size issues
+        using the bulk create. Issues which failed to be created are reported and skipped,
+        so are their sub tasks.
+
+        Returns number of issues which failed to be created
+        """
+        failed = 0
+        while self._queued_issues:
+            tasks = self._queued_issues.pop(min(self._queued_issues))
+            # find existing issues
+            updatable = self.publisher.map(lambda task: task._jira_find_updatable(), tasks)
+            tasks = [task for task, ok in zip(tasks, updatable) if ok]
+            # update fields are gathered here, only requests run on the publisher
+            updates = [(task, task._jira_update_fields()) for task in tasks]
+            self.publisher.map(lambda update: update[0]._jira_update_issue(update[1]),
+                               [update for update in updates if update[1] is not None])
+
+            ready = []
+            for task in tasks:
+                if task._issue:
+                    continue
+                if type(task) == JiraSubTask and not task.parent_task._issue:
+                    self.logger.error("Skipping creation of '%s' as its parent '%s' has no issue" % (
+                        task.summary, task.parent_task.summary))
+                    failed += 1
+                else:
+                    ready.append(task)
+            failed += self._create_issues(ready)
+
+            self._add_to_epics([task for task in tasks if task._issue])
+        return failed
+
+    def _add_to_epics(self, tasks):
+        """
+        Args:
+            tasks (list) - tasks with issues
+
+        Adds issues to their epics with one add_issues_to_epic() call per epic and
+        EPIC_BATCH_SIZE issues. Prefetched issues which already have Epic Link
+        of their epic are skipped.
+        """
+        epic_link_field = self.issue_index.epic_link_field if self.issue_index else None
+        epics = {}  # epic issue id -> [task], in order of tasks
+        for task in tasks:
+            epic = task.epic
+            if not epic:
+                continue
+            if not epic._issue:
+                self.logger.warning("Epic '%s' has no issue. Issue %s was not added to it" % (
+                    epic.summary, task._issue.key))
+                continue
+            if epic_link_field and task._has_epic_link(epic_link_field):
+                self.logger.debug("Issue %s is already under epic %s" % (task._issue.key, epic._issue.key))
+                continue
+            if epic._issue.id not in epics:
+                epics[epic._issue.id] = []
+            epics[epic._issue.id].append(task)
+
+        batches = [(epic_id, epic_tasks[i:i + EPIC_BATCH_SIZE])
+                   for epic_id, epic_tasks in epics.items()
+                   for i in range(0, len(epic_tasks), EPIC_BATCH_SIZE)]
+        self.publisher.map(lambda batch: self.jira_session.add_issues_to_epic(
+            batch[0], issue_keys=[task._issue.id for task in batch[1]], ignore_epics=True), batches)
+        for epic_id, batch in batches:
+            for task in batch:
+                self.logger.info("Added issue %s under epic %s" % (task._issue.key, task.epic._issue.key))
+
+    def _create_issues(self, tasks):
+        """
+        Args:
+            tasks (list) - tasks without issues, their parents have to have issues
+
+        Returns number of issues which failed to be created
+        """
+        # fields are gathered here, only requests run on the publisher
+        field_list = [task._jira_fields for task in tasks]
+        batch_size = max(self.create_batch_size, 1)
+        if batch_size == 1:
+            results = self.publisher.map(self._create_issue, field_list)
+        else:
+            chunks = [field_list[i:i + batch_size] for i in range(0, len(field_list), batch_size)]
+            self.logger.debug("Creating %d issues in %d requests" % (len(field_list), len(chunks)))
+            results = [result for chunk in self.publisher.map(
+                lambda chunk: self.jira_session.create_issues(field_list=chunk, prefetch=False), chunks)
+                for result in chunk]
+
+        failed = 0
+        for task, result in zip(tasks, results):
+            if result["issue"] is None:
+                self.logger.error("Failed to create issue '%s': %s" % (task.summary, result["error"]))
+                failed += 1
+            else:
+                task._issue_created(result["issue"])
+        return failed
+
+    def _create_issue(self, fields):
+        """
+        Args:
+            fields (dict) - see JiraSubTask._jira_fields
+
+        Returns result of a single create_issue() in the same form as items returned by create_issues()
+        """
+        try:
+            issue = self.jira_session.create_issue(fields=fields)
+        except jira.JIRAError as e:
+            return {"status": "Error", "issue": None, "error": u"%s" % e, "input_fields": fields}
+        return {"status": "Success", "issue": issue, "error": None, "input_fields": fields}
+
+    def publish_task_relations(self, transitive_reduction=None):
+        # issues have to exist before they can be linked
+        self.publish_queued_issues()
+        return super(JiraBasedProject, self).publish_task_relations(transitive_reduction)
 
     def fetch_myself(self, force=False):
         return
 
+    def prefetch_issues(self, page_size=PREFETCH_PAGE_SIZE):
+        """
+        Args:
+            page_size=PREFETCH_PAGE_SIZE (int) - issues per search_issues() call
+
+        Fetches all issues of the jira project (and [project] name if mapping_ProjectName is set)
+        with paginated searches into issue_index. fetch_myself() of tasks then only looks up the index.
+        """
+        query = 'project=%s' % self.environment["jira"]["project"]
+        # pair over product! DANGEROUS if unset
+        if "mapping_ProjectName" in self.environment["jira"]:
+            query = '%s AND %s ~ "%s"' % (
+                query, self.environment["jira"]["mapping_ProjectName"], self.conf["project"]["name"])
+        else:
+            self.logger.warning(
+                "mapping_ProjectName is unset. This may lead to unexpected results while updating existing jiras.")
+
+        epic_link_field = None
+        if "mapping_EpicNameQuery" in self.environment["jira"]:
+            epic_link_field = self._get_field(self.environment["jira"]["mapping_EpicNameQuery"])
+        index = JiraIssueIndex(epic_link_field)
+        start = 0
+        while True:
+            self.logger.debug("Prefetching issues %d-%d: %s" % (start, start + page_size, query))
+            issues = self.jira_session.search_issues(query, startAt=start, maxResults=page_size)
+            for issue in issues:
+                index.add(issue)
+            start += len(issues)
+            total = getattr(issues, "total", None)
+            # server may return less than maxResults per page, rely on total when it's known
+            if total is not None:
+                if start >= total or not issues:
+                    break
+            elif len(issues) < page_size:
+                break
+
+        self.logger.info("Prefetched %d existing issues" % start)
+        self.issue_index = index
+
     @property
     def task_class(self):
         return JiraBasedWorkflow
@@ -451,6 +1011,20 @@ class JiraBasedProject(JiraBasedWorkflow, workflow.GenericProject):
                 "Auth %s is not implemented" % options.auth)
 
 
+def field_registry_from_cli(cli):
+    """
+    Args:
+        cli (Cli) - an object representing execution environment
+
+    Returns a new JiraFieldRegistry of [jira] server, persistent if enabled by [cache] jira_fields = True
+    """
+    cache_dir = cli.persistent_cache_dir("jira_fields")
+    ttl = DEFAULT_FIELDS_TTL
+    if cache_dir:
+        ttl = cli.environment["cache"].getint("jira_fields_ttl", DEFAULT_FIELDS_TTL // 60 // 60) * 60 * 60
+    return JiraFieldRegistry(cli.environment["jira"]["server"], cli.logger, cache_dir=cache_dir, ttl=ttl)
+
+
 def handle_project(cli):
     """
     Args:
@@ -472,8 +1046,11 @@ def handle_project(cli):
         cli.logger.info("Using calendar: %s" % url)
         project.schedule.from_url(url)
 
+    project.field_registry = field_registry_from_cli(cli)
     project.jira_session_from_env()
     project.set_action(cli.action)
+    if cli.action == CliAction.UPDATE:
+        project.prefetch_issues()
 
     for workflow_section in cli.project_conf.sections():  # Workflow as in Milestone (e.g Beta) or Epic
         # these are not milestone sections
@@ -494,14 +1071,14 @@ def handle_project(cli):
                     project_relpath, md_path))
                 sys.exit(3)
 
-            fd = codecs.open(md_path, encoding='utf-8')
-            md = markdown.MarkDown()
-            md.logger = cli.logger
-            md.read(fd)
+            md = cli.markdown_cache.parse(md_path, heading_levels=project.heading_levels)
             project.from_markdown(md, override_workflow_name=workflow_section)
             project.relations_from_conf_section(
                 cli.project_conf, workflow_section)
-            project.publish_task_relations()
+
+    # all sections are loaded, create issues and link them at once
+    project.publish_task_relations()
+    project.publisher.shutdown()
     return True  # for testing purposes
 
 
@@ -509,25 +1086,12 @@ class FakeJiraInstance(object):
     def __init__(self):
         self.__issues = {}
         self.__next_id = 1
-        self.__lock = False
-
-    def _lock_session(self):
-        self.__lock = True
-
-    def _unlock_session(self):
-        self.__lock = False
-
-    def _wait_lock(self):
-        while self.__lock:
-            time.sleep(0.5)
-        return
+        self.__lock = threading.Lock()  # issues are created concurrently, see JiraPublisher
 
     def _next_id(self):
-        self._wait_lock()
-        self._lock_session()
-        i = self.__next_id
-        self.__next_id += 1
-        self._unlock_session()
+        with self.__lock:
+            i = self.__next_id
+            self.__next_id += 1
         return i
 
     def client_info(self):
@@ -542,6 +1106,10 @@ class FakeJiraInstance(object):
         self.__issues[issue.id] = issue
         return issue
 
+    def create_issues(self, field_list, prefetch=True):
+        return [{"status": "Success", "issue": self.create_issue(fields), "error": None, "input_fields": fields}
+                for fields in field_list]
+
     def add_issues_to_epic(self, epic_id, issue_keys, ignore_epics=True):
         return
 
@@ -1,6 +1,5 @@
 # -*- coding: utf-8 -*-
 
-import codecs
 import os
 import getpass
 import sys
@@ -8,8 +7,8 @@ import sys
 from redminelib import Redmine, exceptions
 
 import md2workflow.workflow as workflow
-import md2workflow.markdown as markdown
 import md2workflow.schedule as schedule
+import md2workflow.template as template
 
 from md2workflow.cli import get_md_abspath
 from md2workflow.cli import CliAction
@@ -108,19 +107,10 @@ class RedmineSubTask(workflow.GenericTask):
 
     @property
     def description(self):
-        res = self._description.strip()
-        res = res.replace("${Project}", self.conf["project"]["name"])
-        res = res.replace("${Product}", self.conf["project"]["name"])
-
-        if self.parent_by_subclass(RedmineBasedWorkflow):
-            target_version = str(self.parent_by_subclass(
-                RedmineBasedWorkflow).summary)
-            res = res.replace("${Epic}", target_version)
-            res = res.replace("${Milestone}", target_version)
-
         # bold and links should be fine
         # TODO: support url refrences to the git repo
-        return res
+        return self.render_description(template.project_context(
+            self.conf, self.parent_by_subclass(RedmineBasedWorkflow)))
 
     @description.setter
     def description(self, value):
@@ -225,9 +215,9 @@ class RedmineBasedWorkflow(RedmineTask, workflow.GenericWorkflow):
 
         self._published = True # for Update in case that target_version already existed
 
-        def publish_task_relation(self, relation):
-            self.logger.debug("redmine: relations are not supported.")
-            # TODO: write a task comment or a custom field?
+    def publish_task_relation(self, relation):
+        self.logger.debug("redmine: relations are not supported.")
+        # TODO: write a task comment or a custom field?
 
 class RedmineBasedProject(RedmineBasedWorkflow, workflow.GenericProject):
     """
@@ -390,12 +380,10 @@ def handle_project(cli):
                     project_relpath, md_path))
                 sys.exit(3)
 
-            fd = codecs.open(md_path, encoding='utf-8')
-            md = markdown.MarkDown()
-            md.logger = cli.logger
-            md.read(fd)
+            md = cli.markdown_cache.parse(md_path, heading_levels=project.heading_levels)
             project.from_markdown(md, override_workflow_name=workflow_section)
             project.relations_from_conf_section(project.conf, workflow_section)
-            project.publish_task_relation()
 
+    # all sections are loaded, link them at once
+    project.publish_task_relations()
     return True  # for testing purposes
@@ -20,6 +20,8 @@ DEFAULT_CONFIG_DIR = "/etc/md2workflow"
 DEFAULT_CONFIG_PATH = os.path.join(DEFAULT_CONFIG_DIR, "local.conf")
 EXAMPLE_DIR = os.path.join(DEFAULT_CONFIG_DIR, "config")
 USER_CONFIG_DIR = os.path.expanduser(os.path.join("~", ".md2workflow"))
+# Default location of persistent caches, see [cache] in environment config
+DEFAULT_CACHE_DIR = os.path.join(USER_CONFIG_DIR, "cache")
 SHARE_CONFIG_DIR="share/md2workflow/config" # value is used in  setup.py
 
 # for development
@@ -72,6 +74,8 @@ class Cli(object):
         self.project_conf = configparser.ConfigParser()
         self.project_path = None
         self.action = action
+        # .md files referenced by multiple sections are parsed only once per run
+        self.markdown_cache = self.__get_markdown_cache()
 
     def __set_logger(self):
         """
@@ -88,6 +92,31 @@ class Cli(object):
             self.logger.setLevel(logging.INFO)
         #self.logger.debug("Environment config: %s", self.environment._sections)
 
+    def __get_markdown_cache(self):
+        """
+        Returns MarkDownCache, persistent if enabled by [cache] markdown = True
+        """
+        cache_dir = self.persistent_cache_dir("markdown")
+        if not cache_dir:
+            return markdown.MarkDownCache(self.logger)
+
+        max_size = self.environment["cache"].getint(
+            "markdown_max_size", markdown.DEFAULT_CACHE_MAX_SIZE // 1024 // 1024) * 1024 * 1024
+        self.logger.debug("Using markdown cache %s (max %d bytes)" % (cache_dir, max_size))
+        return markdown.MarkDownCache(self.logger, cache_dir=cache_dir, max_size=max_size)
+
+    def persistent_cache_dir(self, key):
+        """
+        Args:
+            key (str) - [cache] option enabling the cache e.g. markdown
+
+        Returns directory for persistent caches if [cache] <key> = True, None otherwise
+        """
+        if not self.environment.has_section("cache") or \
+                not self.environment["cache"].getboolean(key, fallback=False):
+            return None
+        return os.path.expanduser(self.environment["cache"].get("directory", DEFAULT_CACHE_DIR))
+
     @staticmethod
     def validate_config(config):
         """
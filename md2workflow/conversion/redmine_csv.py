@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 import csv
+import sys
 from optparse import OptionParser
 
 import md2workflow.markdown as markdown
@@ -146,9 +147,8 @@ def handle_csv_export(csv_export_path, opts, logger):
         for h5 in h4.nodes:
             logger.debug("%s, %s" % (h5, [str(n) for n in h5.nodes]))
 
-    # Recursive print out
     if not opts.no_print:
-        markdown_parser.print_markdown_tree()
+        markdown_parser.write_markdown(sys.stdout)
 
 def get_optparse():
     parser = OptionParser(usage="%prog [options] your-redmine-export.csv")
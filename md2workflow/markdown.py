@@ -1,17 +1,211 @@
 # -*- coding: utf-8 -*-
 
+import codecs
+import collections
+import hashlib
+import io
+import json
 import logging
+import os
 import re
+import sys
+import zlib
+
+# Events produced by MarkDown.feed(), MarkDown.iterparse() and MarkDownObject.iterevents()
+EVENT_START = "start"
+EVENT_END = "end"
+# Amount of characters read at once by MarkDown.iterparse()
+READ_CHUNK_SIZE = 64 * 1024
+# Bump whenever the parser produces a different tree for the same input.
+# Invalidates documents stored by MarkDownCache on disk.
+PARSER_VERSION = 1
+# Default size limit of the on-disk MarkDownCache (bytes)
+DEFAULT_CACHE_MAX_SIZE = 64 * 1024 * 1024
+
+
+class Token(object):
+    """
+    A single line of a MarkDown document which was already classified by LineTokenizer.
+    Constructors (from_markdown) accept Token so the line doesn't have to be scanned again.
+    """
+    HEADING = "heading"
+    VARIABLE = "variable"
+    PARAGRAPH = "paragraph"
+
+    __slots__ = ("kind", "text", "level", "name", "value")
+
+    def __init__(self, kind, text, level=0, name=None, value=None):
+        """
+        Args:
+            kind (str) - one of Token.HEADING, Token.VARIABLE, Token.PARAGRAPH
+            text (str) - the original line (or heading text without leading #)
+            level=0 (int) - level of a heading
+            name=None (str) - name of a variable
+            value=None (str) - value of a variable
+        """
+        self.kind = kind
+        self.text = text
+        self.level = level
+        self.name = name
+        self.value = value
+
+    def __repr__(self):
+        return "<Token %s %r>" % (self.kind, self.text)
+
+
+class HeadingLevels(object):
+    """
+    Heading levels which are processed as workflow, task and subtask (e.g. Epic, Task and Sub-Task in JIRA).
+    Levels are compiled into a dispatch table level -> role, which is shared by the parser
+    and by the model builder (GenericProject). Other headings are treated as a normal text.
+
+    Instances are immutable, please use HeadingLevels.get() so that projects with the same levels share them.
+    """
+    WORKFLOW = "workflow"
+    TASK = "task"
+    SUBTASK = "subtask"
+
+    __slots__ = ("workflow", "task", "subtask", "roles", "key")
+    _compiled = {}  # (workflow, task, subtask) -> HeadingLevels
+
+    def __init__(self, workflow=1, task=4, subtask=5):
+        """
+        Args:
+            workflow=1 (int) - level of the workflow heading
+            task=4 (int) - level of the task heading
+            subtask=5 (int) - level of the subtask heading
+        """
+        if not 1 <= workflow < task < subtask <= 6:
+            raise ValueError(
+                "Expected heading levels 1 <= workflow < task < subtask <= 6. Got %d, %d, %d" % (
+                    workflow, task, subtask))
+        self.workflow = workflow
+        self.task = task
+        self.subtask = subtask
+        self.roles = {workflow: self.WORKFLOW, task: self.TASK, subtask: self.SUBTASK}
+        # used in cache keys
+        self.key = "%d%d%d" % (workflow, task, subtask)
+
+    @classmethod
+    def get(cls, workflow=1, task=4, subtask=5):
+        """
+        Returns compiled (shared) HeadingLevels
+        """
+        key = (workflow, task, subtask)
+        levels = cls._compiled.get(key)
+        if levels is None:
+            levels = cls._compiled[key] = cls(workflow, task, subtask)
+        return levels
+
+    def role(self, node):
+        """
+        Args:
+            node (MarkDownObject)
+        Returns:
+            str - one of WORKFLOW, TASK, SUBTASK or None if node is not a processed heading
+        """
+        if isinstance(node, Heading):
+            return self.roles.get(node.level)
+        return None
+
+    def __repr__(self):
+        return "<HeadingLevels %d %d %d>" % (self.workflow, self.task, self.subtask)
+
+
+DEFAULT_HEADING_LEVELS = HeadingLevels.get()
+
+
+class LineTokenizer(object):
+    """
+    Classifies each line of a MarkDown document exactly once and returns a Token.
+    Patterns are compiled only once per process.
+
+    Tokenizer also keeps track whether the currently open paragraph is inside
+    of a ``` code fence. The state is updated once per line, so the paragraph
+    text doesn't need to be searched again.
+    """
+    variable_pattern = re.compile(r'^([a-zA-z_0-9 ]+)\s*:\s*(.*)')
+    code_fence = "```"
+
+    def __init__(self, heading_levels=None):
+        """
+        Args:
+            heading_levels=None (HeadingLevels) - headings to process, DEFAULT_HEADING_LEVELS if None
+        """
+        self.heading_levels = heading_levels or DEFAULT_HEADING_LEVELS
+        # Only these headings are processed, rest is treated as normal text
+        self._roles = self.heading_levels.roles
+        self.in_fence = False  # Is the open paragraph inside of a code fence?
+
+    def heading_level(self, line, in_fence=False):
+        """
+        Args:
+            line (str)
+            in_fence=False (bool) - line is a part of an open code fence
+        Returns:
+            int - level of the heading or 0 if line is not a (supported) heading
+        """
+        #  mentioned # in an open comment section of markdown file
+        if in_fence or not line.startswith("#"):
+            return 0
+
+        level = len(line) - len(line.lstrip("#"))
+        if level not in self._roles:  # H can be only 1..6.
+            return 0
+        return level
+
+    def tokenize(self, line, previous_node=None):
+        """
+        Args:
+            line (str) - a single line of a MarkDown document
+            previous_node=None (MarkDownObject) - last node added to the document
+        Returns:
+            Token
+        """
+        in_paragraph = isinstance(previous_node, Paragraph)
+        level = self.heading_level(line, in_paragraph and self.in_fence)
+        if level:
+            self.in_fence = False
+            return Token(Token.HEADING, line[level:].strip(), level=level)
+
+        # Do not process "variable-like" lines in paragraph as variables
+        if not in_paragraph:
+            match = self.variable_pattern.match(line)
+            if match:
+                self.in_fence = False
+                return Token(Token.VARIABLE, line, name=match.group(1), value=match.group(2))
+
+        # Line is either merged into the open paragraph or starts a new one
+        fences = line.count(self.code_fence) % 2
+        if in_paragraph:
+            self.in_fence = self.in_fence != bool(fences)
+        else:
+            self.in_fence = bool(fences)
+        return Token(Token.PARAGRAPH, line)
+
+
+# Shared by static is_* helpers and from_markdown() of individual objects
+_tokenizer = LineTokenizer()
+# Shared nodes of MarkDownObjects without any child nodes
+EMPTY_NODES = ()
 
 
 class MarkDownObject(object):
-    """A generic MarkDownObject"""
+    """
+    A generic MarkDownObject
+
+    Objects use __slots__ as a large document can consist of hundreds of thousands of them.
+    Nodes without children share an empty tuple, the list is created on the first added node.
+    """
+    __slots__ = ("nodes", "__parent", "_head", "_paragraph")
+
+    logger = logging  # Shared by all nodes. Please replace this in MarkDown instance if needed
 
     def __init__(self):
-        self.nodes = []
+        self.nodes = EMPTY_NODES
         self.__parent = None
         self._head = None
-        self.logger = logging  # Please replace this while creating an instance
+        self._paragraph = None  # First multiline child node, following lines are merged into it
 
     @staticmethod
     def is_multiline():
@@ -29,6 +223,20 @@ class MarkDownObject(object):
     def parent(self, obj):
         self.__parent = obj
 
+    def _append_node(self, node):
+        """
+        Args:
+            node - One of MarkDown objects e.g. Heading1
+
+        Appends node to self.nodes and remembers the first multiline node (Paragraph),
+        so following lines can be merged into it without searching through nodes.
+        """
+        if self.nodes is EMPTY_NODES:
+            self.nodes = []
+        if self._paragraph is None and node.is_multiline():
+            self._paragraph = node
+        self.nodes.append(node)
+
     def add_node(self, node):
         """
         Args:
@@ -36,72 +244,92 @@ class MarkDownObject(object):
         """
         if not self._head:  # first element
             node.parent = self  # document
-            node.logger = self.logger
-            self.nodes.append(node)
+            self._append_node(node)
         # are we same level as last block?
         elif self._head.level == node.level:
             # Paragraphs are special, merge objects into ones
-            # Since there is also Variable which has same level, we'll check all nodes on the level of head
+            # Since there is also Variable which has same level, we'll merge into the paragraph of the parent
             node.parent = self._head.parent
-            merged = False
             if node.is_multiline():
-                self.logger.debug(
-                    "Markdown: Found multiline node %s" % repr(node))
-                for child in node.parent.nodes:
-                    self.logger.debug("Markdown: checking child %s multline=%s and type=%s" % (
-                        repr(child), str(child.is_multiline()), type(child)))
-
-                    if int(node.level) == (child.level) and child.is_multiline() and isinstance(child, node.__class__):
-                        self.logger.debug("Markdown: merging nodes %s and %s" % (
-                            repr(node), repr(child)))
-                        child.merge(node)
-                        self.logger.debug("Markdown: merged '%s'" % child.text)
-                        merged = True
-                        self.head = child
-                        return
-                    else:
-                        self.logger.debug("Markdown: node %s doesn't match same level %d (%d) or type %s as child node %s" % (
-                            repr(node), node.level, child.level, type(node), repr(child)))
+                paragraph = node.parent._paragraph
+                if paragraph is not None and isinstance(paragraph, node.__class__):
+                    self.logger.debug(
+                        "Markdown: merging nodes %r and %r", node, paragraph)
+                    paragraph.merge(node)
+                    self._head = paragraph
+                    return
 
             # Everything else should be simply appended to nodes
-            if not node.is_multiline() or not merged:
-                self.logger.debug("Markdown: Adding node %s to %s" %
-                                  (repr(node), repr(self._head.parent)))
-                self._head.parent.nodes.append(node)
+            self.logger.debug("Markdown: Adding node %r to %r",
+                              node, self._head.parent)
+            self._head.parent._append_node(node)
 
         # are we lower (h2 < h1) level than last block?
         elif self._head.level < node.level:
-            self.logger.debug("Markdown: Setting parent of %s to %s" %
-                              (repr(node), repr(self._head)))
+            self.logger.debug("Markdown: Setting parent of %r to %r",
+                              node, self._head)
             node.parent = self._head
-            self._head.nodes.append(node)
+            self._head._append_node(node)
 
         elif self._head.level > node.level:
             while self._head.parent and self._head.level > node.level:
-                self.logger.debug("Markdown: Moving head to parent lvl of node %d > current head %d" % (
-                    node.level, self._head.level))
-                if not self._head.parent:
-                    self.logger.debug("Markdown: head.parent = None")
-                self.logger.debug("Markdown: head.parent.level %d" %
-                                  self._head.parent.level)
+                self.logger.debug("Markdown: Moving head to parent lvl of node %d > current head %d",
+                                  node.level, self._head.level)
                 self._head = self._head.parent
 
-            self.logger.debug("Markdown: Setting parent of %s to %s" %
-                              (repr(node), repr(self._head)))
+            self.logger.debug("Markdown: Setting parent of %r to %r",
+                              node, self._head)
             node.parent = self._head
-            self._head.nodes.append(node)
+            self._head._append_node(node)
         else:
             raise ValueError("This should not happen")
 
         # Always point head at latest added node
         self._head = node
 
-    def print_markdown_tree(self):
-        if self.to_markdown():
-            print (self.to_markdown())
+    def iterevents(self):
+        """
+        Yields (EVENT_START, node) and (EVENT_END, node) tuples for all nodes
+        of the already parsed tree in the document order. The object itself is not included.
+        """
+        stack = [iter(self.nodes)]
+        parents = []
+        while stack:
+            node = next(stack[-1], None)
+            if node is None:
+                stack.pop()
+                if parents:
+                    yield (EVENT_END, parents.pop())
+                continue
+            yield (EVENT_START, node)
+            parents.append(node)
+            stack.append(iter(node.nodes))
+
+    def _markdown_text(self):
+        """
+        Returns text written by write_markdown() for this node (without child nodes)
+        """
+        text = self.to_markdown()
+        if text:
+            return "%s\n" % text
+        return ""
 
-        for node in self.nodes:
-            node.print_markdown_tree()
+    def write_markdown(self, stream):
+        """
+        Args:
+            stream (file-like object) - e.g. sys.stdout or io.StringIO
+
+        Writes the node and all child nodes as MarkDown. The tree is rendered iteratively
+        into a buffer, which is written by a single stream.write().
+        """
+        buf = [self._markdown_text()]
+        for event, node in self.iterevents():
+            if event == EVENT_START:
+                buf.append(node._markdown_text())
+        stream.write("".join(buf))
+
+    def print_markdown_tree(self):
+        self.write_markdown(sys.stdout)
 
 class MarkDown(MarkDownObject):
     """
@@ -118,17 +346,52 @@ class MarkDown(MarkDownObject):
     """
     level = 0  # top level element / Document
 
+    def __init__(self, heading_levels=None):
+        """
+        Args:
+            heading_levels=None (HeadingLevels) - headings to process, DEFAULT_HEADING_LEVELS if None
+        """
+        super(MarkDown, self).__init__()
+        self.nodes = []
+        self._tokenizer = LineTokenizer(heading_levels)
+        self._events = None  # pending events, used only by feed() and iterparse()
+        self._buffer = u""  # incomplete line passed to feed()
+        self._prune = False  # detach ended nodes, used by iterparse()
+
     def read(self, fd):
         """
         Args:
             fd (file descriptor) - parse content of a file
+
+        Content is read at once. Lines keep their line endings.
         """
-        while 1:
-            line = fd.readline()
-            if not line:
-                break
-            self.__handle_line(line)
+        data = fd.read()
         fd.close()
+        for line in data.splitlines(True):
+            self.__handle_line(line)
+
+    def read_bytes(self, data, encoding="utf-8"):
+        """
+        Args:
+            data (bytes) - raw content of a file
+            encoding="utf-8" (str)
+
+        Same as read(), content is decoded at once without any stream reader.
+        """
+        for line in data.decode(encoding).splitlines(True):
+            self.__handle_line(line)
+
+    def read_path(self, path, encoding="utf-8"):
+        """
+        Args:
+            path (str) - path to a .md file
+            encoding="utf-8" (str)
+
+        Fast path for parsing of a file. File is read by one bulk call.
+        """
+        with open(path, "rb") as fd:
+            data = fd.read()
+        self.read_bytes(data, encoding)
 
     def reads(self, text):
         """
@@ -138,37 +401,371 @@ class MarkDown(MarkDownObject):
         for line in text.splitlines():
             self.__handle_line(line)
 
-    def __handle_line(self, line, previous_node=None):
+    @staticmethod
+    def open_file(path, encoding="utf-8"):
+        """
+        Args:
+            path (str) - path to a .md file
+            encoding="utf-8" (str)
+
+        Returns file object suitable for read() and iterparse().
+        Line endings are not translated, same as with codecs.open(), but decoding is done
+        by the io module in bulk instead of codecs stream reader.
+        """
+        return io.open(path, encoding=encoding, newline="")
+
+    def feed(self, data):
+        """
+        Args:
+            data (str) - next chunk of the document
+
+        Push style parsing of a document which arrives in chunks.
+        Lines keep their line endings, same as with read().
+        Events can be collected by read_events(). Please call close() at the end of data.
+        """
+        if self._events is None:
+            self._events = collections.deque()
+        lines = (self._buffer + data).splitlines(True)
+        self._buffer = u""
+        # The last line might be incomplete (or \r of \r\n)
+        if lines and not lines[-1].endswith("\n"):
+            self._buffer = lines.pop()
+        for line in lines:
+            self.__handle_line(line)
+
+    def close(self):
+        """
+        Processes the remaining data passed to feed() and ends all open nodes
+        """
+        if self._events is None:
+            self._events = collections.deque()
+        if self._buffer:
+            self.__handle_line(self._buffer)
+            self._buffer = u""
+        self.__end_nodes(self._head, self)
+
+    def read_events(self):
+        """
+        Yields pending (event, node) tuples produced by feed() and close().
+        Event is EVENT_START or EVENT_END.
+        """
+        while self._events:
+            yield self._events.popleft()
+
+    def iterparse(self, fd):
+        """
+        Args:
+            fd (file descriptor) - parse content of a file
+
+        Yields (event, node) tuples while reading fd. Event is EVENT_START or EVENT_END.
+        Nodes are ended once all of their child nodes were read, so e.g. Paragraph.text
+        is complete only on EVENT_END.
+
+        Nodes are detached from the document once they end
+        so the document never holds the whole tree. Please use read() to get the whole tree.
+        """
+        self._events = collections.deque()
+        self._prune = True
+        while 1:
+            data = fd.read(READ_CHUNK_SIZE)
+            if not data:
+                break
+            self.feed(data)
+            for event in self.read_events():
+                yield event
+        fd.close()
+        self.close()
+        for event in self.read_events():
+            yield event
+
+    def __end_nodes(self, node, parent):
+        """
+        Adds EVENT_END for node and all its parents until parent is reached
+        """
+        while node is not None and node is not parent and node is not self:
+            self._events.append((EVENT_END, node))
+            if self._prune:
+                self.__detach_node(node)
+            node = node.parent
+
+    @staticmethod
+    def __detach_node(node):
+        """
+        Removes ended node from nodes of its parent
+        """
+        # Ended node is the last node of its parent, or the one before
+        # in case that a node which ended it was just added to the same parent
+        nodes = node.parent.nodes
+        if nodes and nodes[-1] is node:
+            nodes.pop()
+        elif len(nodes) > 1 and nodes[-2] is node:
+            del nodes[-2]
+
+    def __add_node(self, node):
+        if self._events is None:
+            self.add_node(node)
+            return
+
+        previous = self._head
+        self.add_node(node)
+        if self._head is node:  # node was not merged into an open paragraph
+            self.__end_nodes(previous, node.parent)
+            self._events.append((EVENT_START, node))
+
+    def __handle_line(self, line):
         line = u"%s" % line  # ensure we're processing it in unicode works for both python2/python3
-        if Heading.is_heading(line, self._head):
+        token = self._tokenizer.tokenize(line, self._head)
+        if token.kind == Token.HEADING:
             self.logger.debug(
-                "Markdown: Line '%s' was identified as heading" % line)
-            self.add_node(Heading.from_markdown(line))
+                "Markdown: Line '%s' was identified as heading", line)
+            self.__add_node(Heading.from_markdown(token))
 
-        elif Variable.is_variable(line, self._head):
+        elif token.kind == Token.VARIABLE:
             self.logger.debug(
-                "Markdown: Line '%s' was identified as variable" % line)
-            self.add_node(Variable.from_markdown(line))
+                "Markdown: Line '%s' was identified as variable", line)
+            self.__add_node(Variable.from_markdown(token))
 
-        elif Paragraph.is_paragraph(line, self._head):
-            self.logger.debug(
-                "Markdown: Line '%s' was identified as paragraph" % line)
-            self.add_node(Paragraph.from_markdown(line))
         else:
             self.logger.debug(
-                "Markdown: Ignoring line as it didn't match any known type.'%s'" % line)
+                "Markdown: Line '%s' was identified as paragraph", line)
+            self.__add_node(Paragraph.from_markdown(token))
+
+    def to_compact(self):
+        """
+        Returns the parsed tree as a flat list of records [parent_index, kind, a, b] in document order.
+        parent_index is an index of the parent record or -1 for the document itself.
+        Headings are stored as "H", level, text; variables as "V", name, value and paragraphs as "P", text, None.
+
+        The list is flat, so it can be serialized (e.g. by json) no matter how deep the tree is.
+        """
+        records = []
+        parents = [-1]
+        for event, node in self.iterevents():
+            if event == EVENT_END:
+                parents.pop()
+                continue
+            if isinstance(node, Heading):
+                records.append([parents[-1], "H", node.level, node.text])
+            elif isinstance(node, Variable):
+                records.append([parents[-1], "V", node.name, node.value])
+            else:
+                records.append([parents[-1], "P", node.text, None])
+            parents.append(len(records) - 1)
+        return records
+
+    def from_compact(self, records):
+        """
+        Args:
+            records (list) - records returned by to_compact()
+
+        Rebuilds the tree without parsing
+        """
+        nodes = []
+        for parent_index, kind, a, b in records:
+            if kind == "H":
+                node = HEADING_CLASSES[a](b)
+            elif kind == "V":
+                node = Variable(a, b)
+            else:
+                node = Paragraph(a)
+            parent = nodes[parent_index] if parent_index >= 0 else self
+            node.parent = parent
+            parent._append_node(node)
+            nodes.append(node)
 
     def to_markdown(self):
         # No text/visual interpretation at all. This would be essentially a project config
         # So if something, then streaming basic project_config with reference to individual .md files
         return
 
+class MarkDownCache(object):
+    """
+    Per-run cache of parsed MarkDown documents keyed by absolute path, content hash and heading levels.
+    Project config can reference the same .md file from multiple sections
+    (e.g. repetitive tasks for milestones), but the file is parsed only once.
+
+    If cache_dir is set, parsed documents are also stored on disk (see MarkDown.to_compact)
+    keyed by content hash, heading levels and PARSER_VERSION, so unchanged files are not parsed by later runs either.
+    The directory is kept under max_size bytes by removing least recently used documents.
+
+    Cached documents are shared, so please do not modify them.
+    """
+
+    def __init__(self, logger=None, cache_dir=None, max_size=DEFAULT_CACHE_MAX_SIZE):
+        """
+        Args:
+            logger=None (logging.Logger)
+            cache_dir=None (str) - directory of the persistent cache, None disables it
+            max_size=DEFAULT_CACHE_MAX_SIZE (int) - size limit of cache_dir in bytes
+        """
+        self.logger = logger or logging
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self._documents = {}  # (abspath, sha256, heading levels, encoding) -> MarkDown
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+    @staticmethod
+    def content_hash(data):
+        """
+        Args:
+            data (bytes) - raw content of a file
+        """
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def normalize_encoding(encoding):
+        """
+        Returns canonical name of the encoding, e.g. utf-8 for UTF8
+        """
+        return codecs.lookup(encoding).name
+
+    def cache_path(self, digest, heading_levels=None, encoding="utf-8"):
+        """
+        Args:
+            digest (str) - content hash of a file
+            heading_levels=None (HeadingLevels)
+            encoding="utf-8" (str) - encoding the file was decoded with
+
+        Returns path of the stored document in cache_dir
+        """
+        heading_levels = heading_levels or DEFAULT_HEADING_LEVELS
+        return os.path.join(self.cache_dir, "%s-h%s-%s-v%d.json.z" % (
+            digest, heading_levels.key, self.normalize_encoding(encoding), PARSER_VERSION))
+
+    def parse(self, path, encoding="utf-8", heading_levels=None):
+        """
+        Args:
+            path (str) - path to a .md file
+            encoding="utf-8" (str)
+            heading_levels=None (HeadingLevels) - headings to process, DEFAULT_HEADING_LEVELS if None
+
+        Returns parsed MarkDown document. File is parsed only on the first call
+        or when its content has changed.
+        """
+        path = os.path.abspath(path)
+        with open(path, "rb") as fd:
+            data = fd.read()
+
+        heading_levels = heading_levels or DEFAULT_HEADING_LEVELS
+        encoding = self.normalize_encoding(encoding)
+        digest = self.content_hash(data)
+        key = (path, digest, heading_levels.key, encoding)
+        md = self._documents.get(key)
+        if md is not None:
+            self.hits += 1
+            self.logger.debug("Using already parsed markdown %s" % path)
+            return md
+
+        md = self.load(digest, heading_levels, encoding)
+        if md is not None:
+            self.disk_hits += 1
+            self.logger.debug("Using cached markdown %s" % path)
+        else:
+            self.misses += 1
+            self.logger.debug("Parsing markdown %s" % path)
+            md = MarkDown(heading_levels)
+            md.logger = self.logger
+            md.read_bytes(data, encoding)
+            self.store(digest, md, heading_levels, encoding)
+        self._documents[key] = md
+        return md
+
+    def load(self, digest, heading_levels=None, encoding="utf-8"):
+        """
+        Args:
+            digest (str) - content hash of a file
+            heading_levels=None (HeadingLevels)
+            encoding="utf-8" (str)
+
+        Returns MarkDown restored from cache_dir or None
+        """
+        if not self.cache_dir:
+            return None
+        cache_path = self.cache_path(digest, heading_levels, encoding)
+        try:
+            with open(cache_path, "rb") as fd:
+                records = json.loads(zlib.decompress(fd.read()).decode("utf-8"))
+            # mtime marks the last use for LRU eviction
+            os.utime(cache_path, None)
+        except (IOError, OSError):
+            return None
+        except (ValueError, zlib.error):
+            self.logger.warning("Ignoring corrupted markdown cache %s" % cache_path)
+            return None
+
+        md = MarkDown(heading_levels)
+        md.logger = self.logger
+        md.from_compact(records)
+        return md
+
+    def store(self, digest, md, heading_levels=None, encoding="utf-8"):
+        """
+        Args:
+            digest (str) - content hash of a file
+            md (MarkDown) - parsed document
+            heading_levels=None (HeadingLevels)
+            encoding="utf-8" (str)
+
+        Stores the document in cache_dir. Failures are not fatal, the document is just parsed next time.
+        """
+        if not self.cache_dir:
+            return
+        data = zlib.compress(json.dumps(md.to_compact(), separators=(",", ":")).encode("utf-8"), 1)
+        if len(data) > self.max_size:
+            return
+        cache_path = self.cache_path(digest, heading_levels, encoding)
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            # write + rename so that concurrent runs never see a partial file
+            tmp_path = "%s.%d.tmp" % (cache_path, os.getpid())
+            with open(tmp_path, "wb") as fd:
+                fd.write(data)
+            os.rename(tmp_path, cache_path)
+            self.evict()
+        except (IOError, OSError) as e:
+            self.logger.warning("Could not store markdown cache %s: %s" % (cache_path, e))
+
+    def evict(self):
+        """
+        Removes least recently used documents until cache_dir fits max_size
+        """
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json.z"):
+                continue
+            entry_path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(entry_path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entry_path))
+            total += st.st_size
+
+        entries.sort()
+        for mtime, size, entry_path in entries:
+            if total <= self.max_size:
+                break
+            self.logger.debug("Evicting markdown cache %s" % entry_path)
+            try:
+                os.remove(entry_path)
+            except OSError:
+                pass
+            total -= size
+
+
 class Paragraph(MarkDownObject):
+    __slots__ = ("__text", "__lines")
     level = 10
 
     def __init__(self, text=None, variables=None):
         super(Paragraph, self).__init__()
         self.__text = text or ""  # Basically a text including newline breaks
+        # Merged lines are buffered and joined only once the text is read
+        self.__lines = None
 
     @staticmethod
     def is_multiline():
@@ -189,14 +786,24 @@ class Paragraph(MarkDownObject):
 
     @property
     def text(self):
+        if self.__lines:
+            self.__text = "\n".join(self.__lines)
+            self.__lines = None
         return self.__text
 
     @text.setter
     def text(self, value):
         self.__text = value
+        self.__lines = None
 
     @staticmethod
     def from_markdown(text):
+        """
+        Args:
+            text (str or Token)
+        """
+        if isinstance(text, Token):
+            return Paragraph(text.text)
         return Paragraph(text)
 
     def merge(self, obj):
@@ -207,24 +814,21 @@ class Paragraph(MarkDownObject):
             obj (Paragraph)
         """
         if isinstance(obj, Paragraph):
-            self.__text += "\n%s" % obj.text
+            if self.__lines is None:
+                self.__lines = [self.__text]
+            self.__lines.append(obj.text)
 
     def __str__(self):
-        return self.__text
+        return self.text
 
     def to_markdown(self):
         # Ensure we have a newline after and before the print out
-        return "%s" % self.__text
+        return "%s" % self.text
 
-    def print_markdown_tree(self):
+    def _markdown_text(self):
         # Print an extra space before and after the paragraph
         # This is the format we actually want in .md files
-        print ()
-        print (self.to_markdown())
-        print ()
-
-        for node in self.nodes:
-            node.print_markdown_tree()
+        return "\n%s\n\n" % self.to_markdown()
 
 
 class Variable(MarkDownObject):
@@ -234,11 +838,9 @@ class Variable(MarkDownObject):
 
     Variable can contain letters, numbers underscore and space
     """
+    __slots__ = ("name", "value")
     level = Paragraph.level  # should be exactly same level as paragraph
 
-    # so it's accessible from staticmethod as well
-    __pattern = r'^([a-zA-z_0-9 ]+)\s*:\s*(.*)'
-
     def __init__(self, name, value):
         super(Variable, self).__init__()
         self.name = str(name)
@@ -256,7 +858,7 @@ class Variable(MarkDownObject):
         if isinstance(data, Variable):
             return True
 
-        if re.search(Variable.__pattern, data):
+        if LineTokenizer.variable_pattern.match(data):
             # Do not process "variable-like" lines in paragraph as variables
             if previous_node and Paragraph.is_paragraph(previous_node):
                 return False
@@ -266,10 +868,15 @@ class Variable(MarkDownObject):
 
     @staticmethod
     def from_markdown(text):
-        match = re.search(Variable.__pattern, text)
-        if not match:
+        """
+        Args:
+            text (str or Token)
+        """
+        if not isinstance(text, Token):
+            text = _tokenizer.tokenize(text)
+        if text.kind != Token.VARIABLE:
             raise ValueError("Expected a string 'name: value'")
-        return Variable(match.groups(1)[0], match.groups(1)[1])
+        return Variable(text.name, text.value)
 
     def __str__(self):
         return self.name
@@ -279,6 +886,7 @@ class Variable(MarkDownObject):
 
 
 class Heading(MarkDownObject):
+    __slots__ = ("__text",)
     level = 1  # 1..6 # Default is 1
 
     @staticmethod
@@ -295,28 +903,14 @@ class Heading(MarkDownObject):
             return data.level
 
         elif not isinstance(data, MarkDownObject):
-             #  mentioned # in an open comment section of markdown file
-            if isinstance(previous_node, Paragraph) and previous_node.text.count("```") % 2:
-                return 0
-
-            i = 0
-            while i <= len(data) - 1 and data[i] == "#":
-                i += 1
-
-            if i > 6:  # H can be only 1..6.
-                i = 0
-
-            # HACK XXX: needs to be configurable. Process only heading 1 4 and 5
-            # Rest should be treat as normal text
-            if i not in (1, 4, 5):
-                return 0
             # HACK XXX: People can easily add comments in code sections
-            return i
+            in_fence = isinstance(previous_node, Paragraph) and \
+                bool(previous_node.text.count(LineTokenizer.code_fence) % 2)
+            return _tokenizer.heading_level(data, in_fence)
         return 0
 
     def __init__(self, text=None):
         super(Heading, self).__init__()
-        self.__nodes = []
         self.__text = None
 
         if text.startswith("#"):
@@ -340,62 +934,60 @@ class Heading(MarkDownObject):
     def from_markdown(text):
         """
         Args:
-            line (str): heading with MarkDown syntax
+            line (str or Token): heading with MarkDown syntax
         Returns:
             automatically detects heading N and returns corresponding HeadingN object
         """
-        lvl = Heading.is_heading(text)
-        text = text[lvl:].strip()
-        if not lvl:
+        if not isinstance(text, Token):
+            text = _tokenizer.tokenize(text)
+        if text.kind != Token.HEADING:
             raise ValueError(
-                ''"%s' was not recognized as a valid MarkDown heading." % text)
-        if lvl == 1:
-            return Heading1(text)
-        elif lvl == 2:
-            return Heading2(text)
-        elif lvl == 3:
-            return Heading3(text)
-        elif lvl == 4:
-            return Heading4(text)
-        elif lvl == 5:
-            return Heading5(text)
-        elif lvl == 6:
-            return Heading6(text)
-        else:
-            raise ValueError("Unexpected value %s" % lvl)
+                ''"%s' was not recognized as a valid MarkDown heading." % text.text)
+        cls = HEADING_CLASSES.get(text.level)
+        if cls is None:
+            raise ValueError("Unexpected value %s" % text.level)
+        return cls(text.text)
 
     def to_markdown(self):
         return "%s %s" % (self.level * "#", self.__text)
 
-    def print_markdown_tree(self):
+    def _markdown_text(self):
         # Print an extra space after the Heading
         # This is the format we actually want in .md files
-        print (self.to_markdown())
         if self.level == 1: # print extra space for Epic level
-            print ()
-
-        for node in self.nodes:
-            node.print_markdown_tree()
+            return "%s\n\n" % self.to_markdown()
+        return "%s\n" % self.to_markdown()
 
 class Heading1(Heading):
+    __slots__ = ()
     level = 1
 
 
 class Heading2(Heading):
+    __slots__ = ()
     level = 2
 
 
 class Heading3(Heading):
+    __slots__ = ()
     level = 3
 
 
 class Heading4(Heading):
+    __slots__ = ()
     level = 4
 
 
 class Heading5(Heading):
+    __slots__ = ()
     level = 5
 
 
 class Heading6(Heading):
+    __slots__ = ()
     level = 6
+
+
+# level -> HeadingN class
+HEADING_CLASSES = dict((cls.level, cls) for cls in (
+    Heading1, Heading2, Heading3, Heading4, Heading5, Heading6))
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+import weakref
+
+# id(conf) -> (weakref to conf, OwnershipMap)
+_ownership_maps = {}
+
+
+class OwnershipMap(object):
+    """
+    [ownership] section of a project config compiled into a group -> owner dict.
+
+    [ownership]
+    markdown_variable = Responsible
+    group_a = foo
+    group_b = bar
+
+    Task with variable "Responsible: group_a" is owned by foo.
+    Groups are matched case insensitive (as ini attr names) and markdown emphasis is ignored,
+    so "Responsible: **Group_A**" is the same group.
+    """
+
+    def __init__(self, variable=None, owners=None):
+        """
+        Args:
+            variable=None (str) - name of the markdown variable with the ownership group
+            owners=None (dict) - group -> owner
+        """
+        self.variable = variable
+        self.owners = dict((self.normalize(group), owner)
+                           for group, owner in (owners or {}).items())
+
+    @staticmethod
+    def normalize(group):
+        return u"%s" % group.replace("*", "").strip().lower()
+
+    @classmethod
+    def from_conf(cls, conf):
+        """
+        Args:
+            conf (ConfigParser) - project config
+
+        Returns a new OwnershipMap, empty if there is no [ownership] or markdown_variable
+        """
+        if not conf.has_section("ownership") or "markdown_variable" not in conf["ownership"]:
+            return cls()
+        return cls(conf["ownership"]["markdown_variable"], dict(conf["ownership"].items()))
+
+    @classmethod
+    def get(cls, conf):
+        """
+        Args:
+            conf (ConfigParser) - project config
+
+        Returns OwnershipMap compiled on the first call for the given conf object.
+        Please make sure that the conf is fully read before the first use.
+        """
+        key = id(conf)
+        entry = _ownership_maps.get(key)
+        if entry and entry[0]() is conf:
+            return entry[1]
+
+        ownership = cls.from_conf(conf)
+        _ownership_maps[key] = (weakref.ref(conf, lambda ref: _ownership_maps.pop(key, None)), ownership)
+        return ownership
+
+    def owner(self, variables):
+        """
+        Args:
+            variables (dict) - variables of a task
+
+        Returns owner of the group from variables or None
+        """
+        if not self.variable or self.variable not in variables:
+            return None
+        return self.owners.get(self.normalize(variables[self.variable]))
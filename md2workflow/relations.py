@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+
+import weakref
+
+# id(environment) -> (weakref to environment, RelationSchema)
+_schemas = {}
+
+
+class RelationSchema(object):
+    """
+    Relation vocabulary of an environment config compiled into sets and dicts.
+
+    [TaskRelations]
+    relations = Blocks, Depends On, Implements, Implemented by
+    inbound = Implemented by, Depends On
+    # optional, see RelationGraph.redundant_edges()
+    transitive_reduction = false
+
+    [JiraTaskRelations]
+    Blocks = Blocks
+    Depends On = Blocks
+
+    Relation names are matched case insensitive (ini attr names are lowercase anyway),
+    so e.g. 'Depends on' in markdown is the same relation as 'Depends On' in the config.
+    """
+
+    def __init__(self, relations=(), inbound=(), link_types=None, transitive_reduction=False):
+        """
+        Args:
+            relations=() (list) - relation names e.g. Blocks, Depends On
+            inbound=() (list) - names of inbound relations (source and target are reversed)
+            link_types=None (dict) - relation name -> backend link type e.g. from [JiraTaskRelations]
+            transitive_reduction=False (bool) - publish only relations not implied by other ones
+        """
+        self.transitive_reduction = transitive_reduction
+        # normalized name -> name as written in the config
+        self.relations = dict((self.normalize(name), name.strip())
+                              for name in relations if name.strip())
+        self.inbound = frozenset(self.normalize(name) for name in inbound if name.strip())
+        self.link_types = dict((self.normalize(name), value)
+                               for name, value in (link_types or {}).items())
+
+    @staticmethod
+    def normalize(name):
+        return u"%s" % name.strip().lower()
+
+    @staticmethod
+    def split(value):
+        """
+        Returns list of names from a comma separated config value
+        Comma is used so the relation can contain space e.g. 'Depends on'
+        """
+        return [name.strip() for name in value.split(",") if name.strip()]
+
+    @classmethod
+    def from_environment(cls, environment, link_types_section="JiraTaskRelations"):
+        """
+        Args:
+            environment (ConfigParser) - environment config
+            link_types_section="JiraTaskRelations" (str) - section with backend link types
+
+        Returns a new RelationSchema
+        """
+        relations = []
+        inbound = []
+        transitive_reduction = False
+        if environment.has_section("TaskRelations"):
+            if not "relations" in environment["TaskRelations"]:
+                raise ValueError(
+                    "Section [TaskRelations] expected variable relations = Relation A ...")
+            relations = cls.split(environment["TaskRelations"]["relations"])
+            inbound = cls.split(environment["TaskRelations"].get("inbound", ""))
+            transitive_reduction = environment["TaskRelations"].getboolean(
+                "transitive_reduction", fallback=False)
+
+        link_types = None
+        if link_types_section and environment.has_section(link_types_section):
+            link_types = dict(environment[link_types_section].items())
+        return cls(relations, inbound, link_types, transitive_reduction)
+
+    @classmethod
+    def get(cls, environment):
+        """
+        Args:
+            environment (ConfigParser) - environment config
+
+        Returns RelationSchema compiled on the first call for the given environment object.
+        Please make sure that the environment is fully read before the first use.
+        """
+        key = id(environment)
+        entry = _schemas.get(key)
+        if entry and entry[0]() is environment:
+            return entry[1]
+
+        schema = cls.from_environment(environment)
+        _schemas[key] = (weakref.ref(environment, lambda ref: _schemas.pop(key, None)), schema)
+        return schema
+
+    @property
+    def names(self):
+        """
+        Returns list of relation names as written in the config
+        """
+        return list(self.relations.values())
+
+    def is_relation(self, name):
+        return self.normalize(name) in self.relations
+
+    def is_inbound(self, name):
+        """
+        Returns True if source and target of the relation need to be reversed
+        """
+        return self.normalize(name) in self.inbound
+
+    def relation_type(self, name):
+        """
+        Args:
+            name (str) - relation name
+
+        Returns key of relations which are of the same kind. That is the backend link type
+        if it's known (e.g. Blocks for both Blocks and Depends On), normalized name otherwise.
+        """
+        key = self.normalize(name)
+        return self.link_types.get(key, key)
+
+    def link_type(self, name):
+        """
+        Args:
+            name (str) - relation name
+
+        Returns backend link type of the relation e.g. value from [JiraTaskRelations]
+        """
+        key = self.normalize(name)
+        if key not in self.relations:
+            raise ValueError("%s is not a relation from [TaskRelations]" % name)
+        if key not in self.link_types:
+            raise ValueError("Link type %s was not found in [JiraTaskRelations]" % name)
+        return self.link_types[key]
+
+
+class RelationCycleError(ValueError):
+    """
+    Raised when relations which are expected to form a DAG contain a cycle
+    """
+
+    def __init__(self, cycle):
+        """
+        Args:
+            cycle (list) - nodes of the cycle, the first node is repeated at the end
+        """
+        self.cycle = cycle
+        super(RelationCycleError, self).__init__(
+            "Relations contain a cycle: %s" % " -> ".join(u"%s" % node for node in cycle))
+
+
+class RelationGraph(object):
+    """
+    Directed graph of tasks where each edge points from relation.source to relation.target.
+    Inbound relations (e.g. Depends On) are already reversed in TaskRelation,
+    so for "B Depends on A" the edge is A -> B (A has to be done first).
+
+    Building the graph is linear in number of nodes plus edges.
+    Nodes are kept in order of addition, so all results are deterministic.
+    """
+
+    def __init__(self):
+        self._index = {}  # node -> position in order of addition
+        self._nodes = []
+        self._successors = {}  # node -> [node]
+        self._predecessors = {}  # node -> [node]
+        self._edges = {}  # (source, target) -> relation
+
+    @classmethod
+    def from_relations(cls, relations, key=None):
+        """
+        Args:
+            relations (iterable) - TaskRelation objects
+            key=None (callable) - only relations where key(relation) is true are used
+
+        Returns a new RelationGraph
+        """
+        graph = cls()
+        for relation in relations:
+            if key is None or key(relation):
+                graph.add_edge(relation.source, relation.target, relation)
+        return graph
+
+    def add_node(self, node):
+        if node not in self._index:
+            self._index[node] = len(self._nodes)
+            self._nodes.append(node)
+            self._successors[node] = []
+            self._predecessors[node] = []
+
+    def add_edge(self, source, target, relation=None):
+        """
+        Args:
+            source - e.g. GenericTask
+            target - e.g. GenericTask
+            relation=None (TaskRelation) - relation represented by the edge
+
+        Parallel edges are ignored, the first relation is kept.
+        """
+        self.add_node(source)
+        self.add_node(target)
+        if (source, target) in self._edges:
+            return
+        self._edges[(source, target)] = relation
+        self._successors[source].append(target)
+        self._predecessors[target].append(source)
+
+    @property
+    def nodes(self):
+        return list(self._nodes)
+
+    @property
+    def edges(self):
+        """
+        Returns list of (source, target) tuples in order of addition
+        """
+        return list(self._edges)
+
+    def relation(self, source, target):
+        """
+        Returns relation represented by the edge source -> target
+        """
+        return self._edges[(source, target)]
+
+    def successors(self, node):
+        return self._successors.get(node, [])
+
+    def predecessors(self, node):
+        return self._predecessors.get(node, [])
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def find_cycle(self):
+        """
+        Returns list of nodes forming a cycle (first node is repeated at the end) or None
+        """
+        WHITE, GRAY, BLACK = 0, 1, 2
+        color = dict.fromkeys(self._nodes, WHITE)
+        for root in self._nodes:
+            if color[root] != WHITE:
+                continue
+            color[root] = GRAY
+            path = [root]
+            stack = [iter(self._successors[root])]
+            while stack:
+                node = next(stack[-1], None)
+                if node is None:
+                    color[path.pop()] = BLACK
+                    stack.pop()
+                elif color[node] == GRAY:
+                    return path[path.index(node):] + [node]
+                elif color[node] == WHITE:
+                    color[node] = GRAY
+                    path.append(node)
+                    stack.append(iter(self._successors[node]))
+        return None
+
+    def waves(self):
+        """
+        Groups nodes into waves. Nodes of a wave depend only on nodes of previous waves,
+        so nodes within the same wave can be processed in parallel.
+
+        Returns list of lists of nodes. Raises RelationCycleError if the graph has a cycle.
+        """
+        indegree = dict((node, len(self._predecessors[node])) for node in self._nodes)
+        wave = [node for node in self._nodes if not indegree[node]]
+        result = []
+        done = 0
+        while wave:
+            result.append(wave)
+            done += len(wave)
+            following = []
+            for node in wave:
+                for successor in self._successors[node]:
+                    indegree[successor] -= 1
+                    if not indegree[successor]:
+                        following.append(successor)
+            following.sort(key=self._index.__getitem__)
+            wave = following
+
+        if done != len(self._nodes):
+            raise RelationCycleError(self.find_cycle())
+        return result
+
+    def topological_order(self):
+        """
+        Returns list of all nodes where each node precedes all of its successors.
+        Raises RelationCycleError if the graph has a cycle.
+        """
+        return [node for wave in self.waves() for node in wave]
+
+    def redundant_edges(self):
+        """
+        Returns list of edges (source, target) implied by other edges, e.g. A -> C if there is A -> B -> C.
+        Removing them gives the transitive reduction of the graph.
+        Raises RelationCycleError if the graph has a cycle.
+        """
+        # descendants of each node as a bitset, computed in reverse topological order
+        # and dropped once all predecessors of the node were processed
+        reach = {}
+        pending = dict((node, len(self._predecessors[node])) for node in self._nodes)
+        redundant = []
+        for node in reversed(self.topological_order()):
+            via = 0  # everything reachable through any successor
+            for successor in self._successors[node]:
+                via |= reach[successor]
+            for successor in self._successors[node]:
+                if via >> self._index[successor] & 1:
+                    redundant.append((node, successor))
+                via |= 1 << self._index[successor]
+                pending[successor] -= 1
+                if not pending[successor]:
+                    del reach[successor]
+            reach[node] = via
+        order = dict((edge, i) for i, edge in enumerate(self._edges))
+        redundant.sort(key=order.__getitem__)
+        return redundant
+
+    def transitive_reduction(self):
+        """
+        Returns a new RelationGraph without the redundant edges
+        """
+        redundant = set(self.redundant_edges())
+        graph = RelationGraph()
+        for node in self._nodes:
+            graph.add_node(node)
+        for edge, relation in self._edges.items():
+            if edge not in redundant:
+                graph.add_edge(edge[0], edge[1], relation)
+        return graph
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+import re
+
+# ${Project} and ${Product} are the project name, ${Epic} and ${Milestone} the workflow summary
+PLACEHOLDERS = ("Project", "Product", "Epic", "Milestone")
+PLACEHOLDER_RE = re.compile(r"\$\{(%s)\}" % "|".join(PLACEHOLDERS))
+
+
+class Template(object):
+    """
+    Text with ${Placeholder} substitutions compiled into a tuple of segments.
+    Literal segments are str, placeholders are (name,) tuples.
+
+    Template.get("Release ${Project} ${Milestone}").render({"Project": "Leap", "Milestone": "Beta"})
+    'Release Leap Beta'
+
+    Placeholders missing in the context are kept as they are.
+    """
+    __slots__ = ("text", "segments")
+    _compiled = {}
+
+    def __init__(self, text):
+        self.text = text
+        segments = []
+        pos = 0
+        for match in PLACEHOLDER_RE.finditer(text):
+            if match.start() > pos:
+                segments.append(text[pos:match.start()])
+            segments.append((match.group(1),))
+            pos = match.end()
+        if pos < len(text):
+            segments.append(text[pos:])
+        self.segments = tuple(segments)
+
+    @classmethod
+    def get(cls, text):
+        """
+        Returns Template of the text, compiled once and shared by all texts of the same value
+        """
+        template = cls._compiled.get(text)
+        if template is None:
+            template = cls._compiled[text] = cls(text)
+        return template
+
+    @property
+    def placeholders(self):
+        """
+        Returns set of placeholder names used in the template
+        """
+        return set(segment[0] for segment in self.segments if isinstance(segment, tuple))
+
+    def render(self, context):
+        """
+        Args:
+            context (dict) - placeholder name -> value
+
+        Returns the text with placeholders substituted in a single pass
+        """
+        if len(self.segments) == 1 and not isinstance(self.segments[0], tuple):
+            return self.segments[0]
+        result = []
+        for segment in self.segments:
+            if isinstance(segment, tuple):
+                value = context.get(segment[0])
+                segment = u"${%s}" % segment[0] if value is None else value
+            result.append(segment)
+        return u"".join(result)
+
+
+def render(text, context):
+    """
+    Args:
+        text (str) - text with placeholders e.g. ${Project}
+        context (dict) - placeholder name -> value
+
+    Returns rendered text, see Template
+    """
+    return Template.get(text).render(context)
+
+
+def project_context(conf, workflow=None):
+    """
+    Args:
+        conf (ConfigParser) - project config, [project] name is used for ${Project} and ${Product}
+        workflow=None (GenericWorkflow) - summary is used for ${Epic} and ${Milestone}
+
+    Returns dict with placeholder values
+    """
+    context = {}
+    if conf and conf.has_section("project") and "name" in conf["project"]:
+        context["Project"] = context["Product"] = conf["project"]["name"]
+    if workflow:
+        context["Epic"] = context["Milestone"] = str(workflow.summary)
+    return context
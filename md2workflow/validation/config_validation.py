@@ -23,6 +23,24 @@ def validate_config_logging(config):
             config["logging"], allowed_keys=["level", ]))
     return errors
 
+def validate_config_cache(config):
+    errors = []
+    if config.has_section("cache"):  # not a mandatory section
+        errors.extend(validation.allowed_section_keys(
+            config["cache"], allowed_keys=["markdown", "markdown_max_size", "jira_fields", "jira_fields_ttl",
+                                           "directory"]))
+        for key in ("markdown", "jira_fields"):
+            if key in config["cache"]:
+                errors.extend(validation.allowed_values(config["cache"], config["cache"][key].lower(),
+                                                        allowed_values=("true", "false", "yes", "no", "1", "0", "on", "off")))
+        if "markdown_max_size" in config["cache"] and not config["cache"]["markdown_max_size"].isdigit():
+            errors.append("[cache] markdown_max_size has to be a number of MiB. Got %s" %
+                          config["cache"]["markdown_max_size"])
+        if "jira_fields_ttl" in config["cache"] and not config["cache"]["jira_fields_ttl"].isdigit():
+            errors.append("[cache] jira_fields_ttl has to be a number of hours. Got %s" %
+                          config["cache"]["jira_fields_ttl"])
+    return errors
+
 def validate_backend_config(config):
     errors = []
     if config["global"]["backend"] == "redmine":
@@ -32,4 +50,7 @@ def validate_backend_config(config):
     elif config["global"]["backend"] == "jira":
         import md2workflow.validation.jira_validation as jira_validation
         errors.extend(jira_validation.validate_jira_section(config))
+        if config.has_section("TaskRelations"):
+            # relations are published as issue links
+            errors.extend(jira_validation.validate_jira_task_relations_section(config))
     return errors
@@ -2,6 +2,7 @@
 
 # Do not use from, it would trick inspect
 import md2workflow.validation as validation
+import md2workflow.relations as relations
 
 allowed_jira_keys = [
                     "server", # https://jira.example.com
@@ -27,6 +28,10 @@ allowed_jira_keys = [
                     "relative_link_topurl", # https://github.com/lkocman/md2workflow/blob/master/example
                     "update_states", # Open, Backlog
                     "epic_update_states",  #Open, Backlog, In Progress
+                    # Number of issues created by one bulk create request, 1 disables bulk create
+                    "create_batch_size", # 50
+                    # Number of concurrent requests to jira
+                    "max_workers", # 1
                 ]
 required_jira_keys = [
                     "server",
@@ -48,8 +53,10 @@ required_task_relations_keys = [
     # where Depends on is the inbound one
     "inbound", # Depends on, Implemented by
     ]
-# All are mandatory
-allowed_task_relations_keys = required_task_relations_keys
+allowed_task_relations_keys = required_task_relations_keys + [
+    # Publish only links which are not implied by other links of the same type
+    "transitive_reduction", # false
+    ]
 
 def validate_jira_section(config):
     errors = []
@@ -60,6 +67,9 @@ def validate_jira_section(config):
             config["jira"], allowed_keys=allowed_jira_keys))
         errors.extend(validation.required_section_keys(
             config["jira"], required_keys=required_jira_keys))
+        for key in ("create_batch_size", "max_workers"):
+            if key in config["jira"] and not (config["jira"][key].isdigit() and int(config["jira"][key])):
+                errors.append("[jira] %s has to be a positive number. Got %s" % (key, config["jira"][key]))
     return errors
 
 
@@ -82,8 +92,9 @@ def validate_jira_task_relations_section(config):
     errors = []
     if not config.has_section("JiraTaskRelations"):
         errors.append("Missing [JiraTaskRelations]. Sections %s" % config._sections)
-    else:
-        jira_task_relations_keys = config["TaskRelations"].keys()
+    elif config.has_section("TaskRelations") and "relations" in config["TaskRelations"]:
+        # keys are relation names from [TaskRelations] relations
+        jira_task_relations_keys = relations.RelationSchema.from_environment(config).names
         errors.extend(validation.allowed_section_keys(
             config["JiraTaskRelations"], allowed_keys=jira_task_relations_keys))
         errors.extend(validation.required_section_keys(
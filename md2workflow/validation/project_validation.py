@@ -10,7 +10,24 @@ def validate_project_section(config):
         errors.append("Missing [project]. Sections %s" % config._sections)
     else:
         errors.extend(validation.allowed_section_keys(
-            config["project"], allowed_keys=["name", "homepage", "identifier"]))
+            config["project"], allowed_keys=["name", "homepage", "identifier", "workflow_heading_level",
+                                             "task_heading_level", "subtask_heading_level"]))
         errors.extend(validation.required_section_keys(
             config["project"], required_keys=["name",]))
     return errors
+
+
+def validate_project_heading_levels(config):
+    errors = []
+    if not config.has_section("project"):
+        return errors  # reported by validate_project_section
+
+    levels = []
+    for key, default in (("workflow_heading_level", 1), ("task_heading_level", 4), ("subtask_heading_level", 5)):
+        value = config["project"].get(key, str(default))
+        errors.extend(validation.allowed_values(config["project"], value,
+                                                allowed_values=("1", "2", "3", "4", "5", "6")))
+        levels.append(value)
+    if not errors and not levels[0] < levels[1] < levels[2]:
+        errors.append("[project] heading levels have to be workflow < task < subtask. Got %s" % ", ".join(levels))
+    return errors
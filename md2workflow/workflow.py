@@ -1,9 +1,17 @@
 # -*- coding: utf-8 -*-
 
+import collections
 import configparser
 import logging
 
+from types import MappingProxyType
+
 import  md2workflow.schedule as schedule
+import md2workflow.template as template
+
+from md2workflow.ownership import OwnershipMap
+
+from md2workflow.relations import RelationCycleError, RelationGraph, RelationSchema
 
 from md2workflow.markdown import *
 
@@ -37,7 +45,85 @@ class TaskRelation(object):
         self.parent = parent
 
 
+class TaskRelationStore(object):
+    """
+    Relations of a workflow in order of addition.
+
+    Relations are indexed by an unordered pair of tasks, so a relation in between two tasks
+    is found in O(1) no matter of its direction. Inbound and outbound relations of each task
+    are kept in adjacency lists.
+
+    Behaves as a read-only list of TaskRelation objects.
+    """
+
+    def __init__(self):
+        self._relations = []
+        self._by_pair = {}  # frozenset((source, target)) -> TaskRelation
+        self._outbound = {}  # source -> [TaskRelation]
+        self._inbound = {}  # target -> [TaskRelation]
+
+    @staticmethod
+    def pair(source, target):
+        return frozenset((source, target))
+
+    def find(self, source, target):
+        """
+        Args
+            source (GenericTask)
+            target (GenericTask)
+
+        Returns relation in between source and target (any direction) or None
+        """
+        return self._by_pair.get(self.pair(source, target))
+
+    def add(self, relation):
+        """
+        Args
+            relation (TaskRelation)
+
+        Returns False if the tasks already have a relation, True otherwise
+        """
+        key = self.pair(relation.source, relation.target)
+        if key in self._by_pair:
+            return False
+        self._by_pair[key] = relation
+        self._relations.append(relation)
+        self._outbound.setdefault(relation.source, []).append(relation)
+        self._inbound.setdefault(relation.target, []).append(relation)
+        return True
+
+    def outbound(self, task):
+        """
+        Returns list of relations where task is the source
+        """
+        return self._outbound.get(task, [])
+
+    def inbound(self, task):
+        """
+        Returns list of relations where task is the target
+        """
+        return self._inbound.get(task, [])
+
+    def __iter__(self):
+        return iter(self._relations)
+
+    def __len__(self):
+        return len(self._relations)
+
+    def __getitem__(self, i):
+        return self._relations[i]
+
+
 class GenericTask(object):
+    _owner = None
+    _owner_resolved = False
+    _rendered = None  # (inputs, rendered description), see render_description()
+    # "workflow" or "project" for tasks other tasks can be attached to, see ancestor()
+    _role = None
+    # role -> nearest parent with the role, maintained by the parent_task setter
+    _ancestors = {}
+    _child_ancestors = None  # _ancestors shared by all child tasks
+
     def __init__(self, summary, description=None, environment=None, conf=None):
         self.summary = summary
         self.description = description
@@ -68,7 +154,11 @@ class GenericTask(object):
         return self._variables
 
     def add_variable(self, name, value):
+        if not isinstance(self._variables, dict):
+            self._variables = dict(self._variables)  # shared by a WorkflowTemplate
         self._variables[name] = value
+        if name == OwnershipMap.get(self.conf).variable:
+            self._owner_resolved = False
         self.logger.debug("Adding variable %s=%s to (%s)" %
                           (name, value, self.variables))
     @property
@@ -86,20 +176,26 @@ class GenericTask(object):
         """
         self._calendar_entry = value
     @property
+    def conf(self):
+        return self._conf
+
+    @conf.setter
+    def conf(self, conf):
+        self._conf = conf
+        self._owner_resolved = False
+
+    @property
     def owner(self):
-        try:
-            group = self.variables[self.conf['ownership']['markdown_variable']]
-            group = group.replace("*", "").strip()
-            self.logger.debug(
-                "Found ownership group %s for task %s" % (group, self.summary))
-            ownr = self.conf['ownership'][group]
-            self.logger.debug("Found owner %s for task %s" %
-                              (ownr, self.summary))
-            return ownr
-        except KeyError:
-            pass
-            #self.logger.debug("Failed to find owner for task %s. Variables: %s Conf: %s" % (self.summary, self.variables, self.conf._sections))
-        return None
+        """
+        Returns owner of the ownership group set in the [ownership] markdown_variable or None.
+        Resolved once, the ownership variable or conf change resets it.
+        """
+        if not self._owner_resolved:
+            self._owner = OwnershipMap.get(self.conf).owner(self.variables)
+            self._owner_resolved = True
+            if self._owner:
+                self.logger.debug("Found owner %s for task %s" % (self._owner, self.summary))
+        return self._owner
 
     @property
     def supports_tasks():
@@ -123,6 +219,24 @@ class GenericTask(object):
             text = ""
         self._description = text.strip() or ""  # Make sure there is not None
 
+    def render_description(self, context, convert=None):
+        """
+        Args:
+            context (dict) - placeholder values e.g. from md2workflow.template.project_context()
+            convert=None (callable) - convert(text, context) applied to the rendered text
+                e.g. conversion of markdown to the backend markup
+
+        Returns description with substituted placeholders.
+        The result is memoized until the description, context or convert change.
+        """
+        inputs = (self._description, context, convert)
+        if self._rendered is None or self._rendered[0] != inputs:
+            text = template.render(self._description.strip(), context)
+            if convert:
+                text = convert(text, context)
+            self._rendered = (inputs, text)
+        return self._rendered[1]
+
     @property
     def parent_task(self):
         # Setter part is done in add_child_task
@@ -134,58 +248,119 @@ class GenericTask(object):
         self.logger.debug("Setting parent '%s' to task '%s'" %
                           (self.summary, task.summary))
         self._parent_task = task
+        self._update_ancestors()
 
-    def parent_by_subclass(self, subclass):
+    def _update_ancestors(self):
+        """
+        Records references to the workflow and project above the task and all its child tasks.
+        Tasks are usually attached top-down, so there are no child tasks to visit.
+        """
+        stack = [self]
+        while stack:
+            task = stack.pop()
+            parent = task._parent_task
+            if parent is None:
+                task._ancestors = {}
+            else:
+                if parent._child_ancestors is None:
+                    parent._child_ancestors = dict(parent._ancestors)
+                    if parent._role:
+                        parent._child_ancestors[parent._role] = parent
+                task._ancestors = parent._child_ancestors
+            task._child_ancestors = None
+            stack.extend(task._tasks)
+
+    def ancestor(self, role):
         """
         Args:
-            subclass (class name)
+            role (str) - "workflow" or "project"
 
-        Iterates over parents of object until it finds nearest instance of a matching subclass.
-        Returns object matching given subclass or None if not found
+        Returns the task itself or the nearest parent with the given role or None
         """
-        head = self
+        if self._role == role:
+            return self
+        return self._ancestors.get(role)
 
-        if issubclass(type(head), subclass):
-            return head
+    def parent_by_subclass(self, subclass):
+        """
+        Args:
+            subclass (class name)
 
-        while head.parent_task and not issubclass(type(head), subclass):
-            head = head.parent_task
+        Returns the object itself or its nearest parent matching given subclass or None if not found
+        """
+        parent = self._parent_task
+        workflow = self._ancestors.get("workflow")
+        project = self._ancestors.get("project")
+        if parent is None or parent._parent_task in (None, workflow, project):
+            # no other levels in between, use recorded ancestors
+            parents = (self, parent, workflow, project)
+        else:
+            parents = [self]
+            while parents[-1].parent_task:
+                parents.append(parents[-1].parent_task)
 
-        if not issubclass(type(head), subclass):
-            self.logging.warning("Couldn't find parent of  %s with subclass %s" % (
-                repr(self), repr(subclass)))
-            return None  # Did not find anything, just return itself
+        for head in parents:
+            if head is not None and issubclass(type(head), subclass):
+                return head
 
-        return head
+        self.logger.warning("Couldn't find parent of %s with subclass %s" % (
+            repr(self), repr(subclass)))
+        return None
 
-    def get_task_by_summary(self, summary, from_top=False):
+    def get_task_by_summary(self, summary, from_top=False, workflow=None):
         """
         Args
             summary (str) - summary of a task (uid)
             from_top=False - start to seek from the project/workflow level
+            workflow=None (GenericWorkflow) - with from_top prefer tasks of this workflow
+
+        The project/workflow level lookup uses the summary index maintained by add_task().
+        If the summary is used in several workflows and none of them is the preferred one,
+        the ambiguity is reported and the first added task is returned.
         """
         summary = u"%s" % summary.strip()
         if self.summary == summary:
             return self
 
-        for task in self.tasks:
-            if task.summary == summary:
-                return task.get_task_by_summary(summary)
+        task = self._get_child_by_summary(summary)
+        if task:
+            return task
 
         if from_top:
-            top = self.parent_by_subclass(GenericWorkflow)
-            # we do have a project (might not be case for unittests)
-            if top.parent_task:
-                top = top.parent_task
-
-            for task in top.tasks:
-                res = task.get_task_by_summary(summary)
-                if res:
-                    return res
+            top = self._get_top()
+            matches = top.get_tasks_by_summary(summary)
+            for task in matches:
+                if task is workflow or task.parent_task is workflow:
+                    return task
+            if len(matches) == 1:
+                return matches[0]
+            elif matches:
+                self.logger.warning("Summary '%s' is ambiguous, it's used in workflows: %s. Using '%s'" % (
+                    summary, ", ".join([str(t.parent_task) for t in matches]), matches[0].parent_task))
+                return matches[0]
 
         self.logger.warning("Could not find task with summary '%s'" % summary)
         return None
 
+    def _get_child_by_summary(self, summary):
+        """
+        Returns the first of direct child tasks with the given summary or None
+        """
+        for task in self.tasks:
+            if task.summary == summary:
+                return task
+        return None
+
+    def _get_top(self):
+        """
+        Returns project or workflow (in case there is no project) where the task belongs to
+        """
+        top = self.parent_by_subclass(GenericWorkflow)
+        # we do have a project (might not be case for unittests)
+        if top.parent_task:
+            top = top.parent_task
+        return top
+
     @property
     def tasks(self):
         return self._tasks
@@ -205,6 +380,9 @@ class GenericNestedTask(GenericTask):
         """
         Returns a new instance of class returned by task_class()
         """
+        # add_task() sets them anyway, do not create empty configs for every task
+        kwargs.setdefault("environment", self.environment)
+        kwargs.setdefault("conf", self.conf)
         return self.task_class(**kwargs)
 
     def add_task(self, task):
@@ -220,6 +398,9 @@ class GenericNestedTask(GenericTask):
         task.environment = self.environment
         task.conf = self.conf
         self._tasks.append(task)
+        # workflow (or project) above indexes also tasks of its tasks
+        if isinstance(self.parent_task, GenericWorkflow):
+            self.parent_task._index_task(task)
 
         self.logger.debug("Added child task '%s' under '%s'" %
                           (task.summary, self.summary))
@@ -230,6 +411,15 @@ class TaskPlaceHolder(GenericTask):
     This is a class which is used to reference not yet created target of a relation
     """
 
+    def __init__(self, summary, workflow=None, **kwargs):
+        """
+        Args
+            summary (str) - summary of the referenced task
+            workflow=None (GenericWorkflow) - workflow where the reference was made
+        """
+        super(TaskPlaceHolder, self).__init__(summary, **kwargs)
+        self.workflow = workflow
+
     def publish(self):
         raise ValueError(
             "TaskPlaceHolder should never be published. Please make sure to replace them properly")
@@ -240,11 +430,42 @@ class GenericWorkflow(GenericNestedTask):
     Worklfow is basically a task which gives tasks and nested tasks order and introduces relations
     Relations need to be supported with a environment config .environment file definig them
     """
+    _role = "workflow"
 
     def __init__(self, summary, description=None, environment=None, conf=None):
         super(GenericWorkflow, self).__init__(
             summary, description, environment, conf)
-        self._task_relations = []
+        self._task_relations = TaskRelationStore()
+        # summary -> [tasks] for tasks of this workflow and their tasks (in order of addition)
+        self._summary_index = {}
+
+    def add_task(self, task):
+        """
+        Args
+            task (GenericTask)
+        """
+        super(GenericWorkflow, self).add_task(task)
+        self._index_task(task)
+        for child in task.tasks:
+            self._index_task(child)
+
+    def _index_task(self, task):
+        self._summary_index.setdefault(task.summary, []).append(task)
+
+    def _get_child_by_summary(self, summary):
+        for task in self._summary_index.get(summary, []):
+            if task.parent_task is self:
+                return task
+        return None
+
+    def get_tasks_by_summary(self, summary):
+        """
+        Args
+            summary (str) - summary of a task
+
+        Returns list of all tasks of the workflow and their tasks with the given summary
+        """
+        return self._summary_index.get(u"%s" % summary.strip(), [])
 
     def _replace_task_placeholders(self):
         """
@@ -258,32 +479,44 @@ class GenericWorkflow(GenericNestedTask):
         # first find all references to the PlaceHolder
         for i in range(len(self.tasks)):
             if issubclass(type(self.tasks[i]), TaskPlaceHolder):
-                tasks[i] = self.get_task_by_summary(
-                    self.tasks[i].summary, from_top=True)
+                self.tasks[i] = self.get_task_by_summary(
+                    self.tasks[i].summary, from_top=True, workflow=self.tasks[i].workflow)
 
-        # update all references in relations
-        for i in range(len(self.task_relations)):
-            if issubclass(type(self.task_relations[i].target), TaskPlaceHolder) or \
-                    issubclass(type(self.task_relations[i].source), TaskPlaceHolder):
+        # update all references in relations, the store is rebuilt as the indexed pairs change
+        relations = TaskRelationStore()
+        for old in self.task_relations:
+            relation = old
+            if issubclass(type(old.target), TaskPlaceHolder) or \
+                    issubclass(type(old.source), TaskPlaceHolder):
 
                 self.logger.debug("Replacing Placeholder relation reference for %s -> %s" %
-                                  (self.task_relations[i].source, self.task_relations[i].target))
-                t = self.get_task_by_summary(
-                    self.task_relations[i].target.summary, from_top=True)
-                s = self.get_task_by_summary(
-                    self.task_relations[i].source.summary, from_top=True)
-                assert t != None, "Relations: Could not find task with summary '%s'" % self.task_relations[
-                    i].target.summary
-                assert s != None, "Relations: Could not find task with summary '%s'" % self.task_relations[
-                    i].source.summary
+                                  (old.source, old.target))
+                t = self._resolve_placeholder(old.target)
+                s = self._resolve_placeholder(old.source)
+                assert t != None, "Relations: Could not find task with summary '%s'" % old.target.summary
+                assert s != None, "Relations: Could not find task with summary '%s'" % old.source.summary
                 relation = TaskRelation(
-                    relation_name=self.task_relations[i].relation_name,
+                    relation_name=old.relation_name,
                     parent=self,
                     source=s,
                     target=t
                 )
 
-                self.task_relations[i] = relation
+            if not relations.add(relation):
+                self.logger.debug("Some relation in between %s and %s already exists. Skipping creation" % (
+                    relation.source, relation.target))
+        self._task_relations = relations
+
+    def _resolve_placeholder(self, task):
+        """
+        Args
+            task (GenericTask)
+
+        Returns the referenced task if task is a TaskPlaceHolder, task itself otherwise
+        """
+        if isinstance(task, TaskPlaceHolder):
+            return self.get_task_by_summary(task.summary, from_top=True, workflow=task.workflow)
+        return task
 
     @property
     def task_class(self):
@@ -298,17 +531,13 @@ class GenericWorkflow(GenericNestedTask):
         Args
             source (GenericTask)
             target (GenericTask)
+
+        Returns list with the relation in between source and target (any direction) or an empty list
         """
-        result = []
-        for relation in self.task_relations:
-            # check both directions
-            if (relation.source == source and relation.target == target) or \
-                    (relation.source == target and relation.target == source):
-                result.append(relation)
-        if result:
-            assert len(
-                result) == 1, "Expected only one relation in between two tasks. %s" % result
-        return result
+        relation = self._task_relations.find(source, target)
+        if relation:
+            return [relation]
+        return []
 
     def add_task_relation(self, relation):
         """
@@ -325,17 +554,32 @@ class GenericWorkflow(GenericNestedTask):
                 "Expected instance of TaskRelation. Got %s" % type(relation))
         self.logger.info("Adding relation %s %s %s" % (
             relation.source, relation.relation_name, relation.target))
-        if self.find_relation(relation.source, relation.target):
+        if not self._task_relations.add(relation):
             logging.debug("Some relation in between %s and %s already exists. Skipping creation" % (
                 relation.source, relation.target))
-        else:
-            self._task_relations.append(relation)
 
-    def get_task_or_placeholder_by_summary(self, summary):
-        result = self.get_task_by_summary(summary, from_top=True)
+    def get_task_or_placeholder_by_summary(self, summary, workflow=None):
+        """
+        Args
+            summary (str) - summary of a task
+            workflow=None (GenericWorkflow) - prefer tasks of this workflow
+
+        Returns the task or TaskPlaceHolder if the task was not yet created
+        """
+        if workflow is not None:
+            # The task can be still added to the workflow later, so tasks of other workflows
+            # are considered only once everything is loaded (see _replace_task_placeholders)
+            result = None
+            for task in self._get_top().get_tasks_by_summary(summary):
+                if task is workflow or task.parent_task is workflow:
+                    result = task
+                    break
+        else:
+            result = self.get_task_by_summary(summary, from_top=True)
         if not result:
             logging.debug("Creating a task placeholder for %s" % summary)
-            result = TaskPlaceHolder(summary)
+            result = TaskPlaceHolder(
+                summary, workflow=workflow, environment=self.environment, conf=self.conf)
         return result
 
     def _variable_is_calendar(self, variable):
@@ -376,68 +620,255 @@ class GenericWorkflow(GenericNestedTask):
             raise ValueError("Expected a Variable node, got %s" %
                              type(variable))
 
-        if self.environment.has_section("TaskRelations"):
-            if not "relations" in self.environment["TaskRelations"]:
-                raise ValueError(
-                    "Section [TaskRelations] expected variable relations = Relation A ...")
-
+        if self.relation_schema.is_relation(variable.name):
             self.logger.debug(
-                "Testing if variable '%s' is a relation" % variable.name)
-            if u"%s" % variable.name.lower() in [u"%s" % x.lower().strip() for x in self.environment["TaskRelations"]["relations"].split(",")]:
-                self.logger.debug(
-                    "variable %s was identified as a relation" % variable)
-                return True
-            else:
-                self.logger.debug("variable '%s' was not identified as a relation. (Supported list: %s)" % (
-                    variable.name, self.environment["TaskRelations"]["relations"]))
+                "variable %s was identified as a relation", variable)
+            return True
         return False
 
-    def publish_task_relations(self):
+    @property
+    def relation_schema(self):
+        """
+        Returns RelationSchema compiled from [TaskRelations] of the environment config
+        """
+        return RelationSchema.get(self.environment)
+
+    def relation_graph(self):
+        """
+        Returns RelationGraph of relations of this workflow
+        """
+        return RelationGraph.from_relations(self.task_relations)
+
+    def publish_task_relations(self, transitive_reduction=None):
         """
         This needs to be called after all tasks were published.
+
+        Args:
+            transitive_reduction=None (bool) - skip relations implied by other relations
+                of the same type. Defaults to transitive_reduction from [TaskRelations]
+
+        Returns number of relations (API calls) skipped by the transitive reduction
         """
         self._replace_task_placeholders()
+        redundant = self._redundant_task_relations(self.task_relations, transitive_reduction)
+        self._publish_resolved_task_relations(redundant)
+        return len(redundant)
+
+    def _redundant_task_relations(self, task_relations, transitive_reduction=None):
+        """
+        Args:
+            task_relations (iterable) - TaskRelation objects with resolved placeholders
+            transitive_reduction=None (bool) - defaults to transitive_reduction from [TaskRelations]
+
+        Returns set of ids of relations implied by other relations of the same type
+        e.g. A Depends on C if there is A Depends on B and B Depends on C.
+        Empty set if the transitive reduction is not enabled.
+        """
+        if transitive_reduction is None:
+            transitive_reduction = self.relation_schema.transitive_reduction
+        if not transitive_reduction:
+            return set()
+
+        schema = self.relation_schema
+        graphs = collections.OrderedDict()  # relation type -> RelationGraph
+        for relation in task_relations:
+            if not relation.source or not relation.target:
+                continue
+            relation_type = schema.relation_type(relation.relation_name)
+            if relation_type not in graphs:
+                graphs[relation_type] = RelationGraph()
+            graphs[relation_type].add_edge(relation.source, relation.target, relation)
+
+        redundant = set()
+        for relation_type, graph in graphs.items():
+            try:
+                edges = graph.redundant_edges()
+            except RelationCycleError as e:
+                self.logger.warning("Not reducing %s relations. %s" % (relation_type, e))
+                continue
+            redundant.update(id(graph.relation(*edge)) for edge in edges)
+
+        if redundant:
+            self.logger.info("Transitive reduction skipped %d redundant task relations (API calls)" % len(
+                redundant))
+        return redundant
+
+    def _publish_resolved_task_relations(self, redundant=()):
+        """
+        Publishes relations of the workflow. Placeholders have to be already replaced.
+
+        Args:
+            redundant=() (set) - ids of relations to skip, see _redundant_task_relations()
+        """
+        for relation in self._relations_to_publish(redundant):
+            self.publish_task_relation(relation)
+
+    def _relations_to_publish(self, redundant=()):
+        """
+        Args:
+            redundant=() (set) - ids of relations to skip, see _redundant_task_relations()
+
+        Yields relations of the workflow which are not redundant and have both source and target
+        """
         for relation in self.task_relations:
+            if id(relation) in redundant:
+                self.logger.debug("Skipping redundant task relation %s" % repr(relation))
+                continue
             self.logger.debug("Publishing task relation %s" % repr(relation))
             if not relation.source or not relation.target:
                 self.logger.warning("Could not one of find relation items source=%s target=%s. SKIPPING" % (
                     relation.source, relation.target))
                 continue
-            self.publish_task_relation(relation)
+            yield relation
 
-    def publish_task_relation(self):
+    def publish_task_relation(self, relation):
         """
+        Args:
+            relation (TaskRelation)
+
         Please override me
         """
         pass
 
 
+class WorkflowTemplate(object):
+    """
+    Markdown document compiled into a flat tuple of operations creating a workflow.
+
+    The template is immutable and built once per document (see GenericProject.workflow_template()),
+    each project section using the document only replays the operations.
+    Instances share summaries, descriptions and variables (read-only mappings copied on write
+    by add_variable()), relations, calendar entries and backend state are per instance.
+
+    Operations are tuples (code, task index, arguments...), tasks are indexed in order of creation.
+    """
+    __slots__ = ("ops",)
+
+    NEW_WORKFLOW = 0  # (code, None, summary, summary can be overridden)
+    NEW_NAMED_WORKFLOW = 1  # (code, None) workflow named by override_workflow_name
+    NEW_TASK = 2  # (code, head, summary) task under the workflow of head
+    NEW_SUBTASK = 3  # (code, head, summary) task under the nearest nested task
+    VARIABLES = 4  # (code, task, variables)
+    DESCRIPTION = 5  # (code, task, description) sets description and publishes the task
+    RELATION = 6  # (code, task, relation name, summary of the other task)
+    CALENDAR = 7  # (code, task, calendar event name)
+    PUBLISH = 8  # (code, task) publishes the task unless it's already published
+
+    def __init__(self, ops):
+        self.ops = tuple(ops)
+
+    def __len__(self):
+        return len(self.ops)
+
+
 class GenericProject(GenericWorkflow):
     """
     Project may contain several linked workflows and supports from_markdown()
+
+    Workflows are loaded first (from_markdown() and relations_from_conf_section() for every section).
+    publish_task_relations() then resolves all TaskPlaceHolder references and publishes
+    relations of the project and of all workflows at once.
     """
+    _role = "project"
+    _task_relations_published = False
+    _workflow_templates = None  # id(MarkDown) -> (MarkDown, WorkflowTemplate)
+
     @property
     def task_class(self):
         return GenericWorkflow
 
+    def relation_graph(self):
+        """
+        Returns RelationGraph of relations of the project and all its workflows.
+        Please call resolve_task_placeholders() first.
+        """
+        graph = RelationGraph.from_relations(self.task_relations)
+        for workflow in self.tasks:
+            for relation in workflow.task_relations:
+                graph.add_edge(relation.source, relation.target, relation)
+        return graph
+
+    def resolve_task_placeholders(self):
+        """
+        Replaces TaskPlaceHolder references in relations of the project and all its workflows.
+        Each relation is visited once, lookups use the summary index.
+        """
+        self._replace_task_placeholders()
+        for workflow in self.tasks:
+            workflow._replace_task_placeholders()
+
+    def publish_task_relations(self, transitive_reduction=None):
+        """
+        Publishes relations of the project and all its workflows.
+        This needs to be called once after all workflows were loaded and published.
+
+        Args:
+            transitive_reduction=None (bool) - skip relations implied by other relations
+                of the same type across all workflows. Defaults to transitive_reduction from [TaskRelations]
+
+        Returns number of relations (API calls) skipped by the transitive reduction
+        """
+        if self._task_relations_published:
+            self.logger.debug("Task relations of %s were already published. Skipping" % self)
+            return 0
+        self.resolve_task_placeholders()
+        cycle = self.relation_graph().find_cycle()
+        if cycle:
+            self.logger.warning("Task relations contain a cycle: %s" % " -> ".join(
+                u"%s" % task for task in cycle))
+        task_relations = list(self.task_relations)
+        for workflow in self.tasks:
+            task_relations.extend(workflow.task_relations)
+        redundant = self._redundant_task_relations(task_relations, transitive_reduction)
+        self._publish_resolved_task_relations(redundant)
+        for workflow in self.tasks:
+            workflow._publish_resolved_task_relations(redundant)
+        self._task_relations_published = True
+        return len(redundant)
+
     def from_markdown(self, obj, override_workflow_name=None):
         if not isinstance(obj, MarkDown):
             raise ValueError(
                 "Expected a md2workflow.MarkDown object as an argument")
-        self._process_markdown_node(
-            obj, override_workflow_name=override_workflow_name)
+        self._instantiate_workflow_template(
+            self.workflow_template(obj), override_workflow_name=override_workflow_name)
+
+    def from_markdown_events(self, events, override_workflow_name=None):
+        """
+        Args
+            events (iterable) - (event, node) tuples e.g. from MarkDown.iterparse()
+            override_workflow_name=None (str)
+
+        Builds tasks directly from the events without holding the whole markdown tree
+        """
+        self._instantiate_workflow_template(
+            self._compile_markdown_events(events), override_workflow_name=override_workflow_name)
+
+    def workflow_template(self, md):
+        """
+        Args
+            md (MarkDown) - parsed markdown document
+
+        Returns WorkflowTemplate of the document compiled once per project.
+        The same document used by several sections (e.g. repetitive tasks for milestones)
+        is compiled only once.
+        """
+        if self._workflow_templates is None:
+            self._workflow_templates = {}
+        entry = self._workflow_templates.get(id(md))
+        if not entry or entry[0] is not md:
+            # the document is kept referenced, so its id is not reused
+            entry = self._workflow_templates[id(md)] = (md, self._compile_markdown_events(md.iterevents()))
+        return entry[1]
 
     def relations_from_conf_section(self, config, section_name):
-        for relation in self.environment["TaskRelations"]['relations'].split(','):
-            relation = relation.strip()
+        schema = self.relation_schema
+        for relation in schema.names:
             # ini does attr names lowercase
-            if relation.lower() not in config[section_name].keys():
+            if relation.lower() not in config[section_name]:
                 continue
             # is this an inbound relation (need to reverse target/source)
-            inbound = False
-            for inbound_relation in self.environment["TaskRelations"]['inbound'].split(','):
-                if relation == inbound_relation.strip():
-                    inbound = True
+            inbound = schema.is_inbound(relation)
 
             for target in config[section_name][relation].split(","):
                 t = None
@@ -460,136 +891,247 @@ class GenericProject(GenericWorkflow):
                         target=t)  # At this point the task is most likely not yet created, store name reference instead
                 )
 
+    @property
+    def heading_levels(self):
+        """
+        Returns HeadingLevels configured by workflow_heading_level, task_heading_level
+        and subtask_heading_level in [project] section of the project config (defaults are 1, 4 and 5)
+        """
+        if not self.conf.has_section("project"):
+            return DEFAULT_HEADING_LEVELS
+        section = self.conf["project"]
+        return HeadingLevels.get(
+            section.getint("workflow_heading_level", DEFAULT_HEADING_LEVELS.workflow),
+            section.getint("task_heading_level", DEFAULT_HEADING_LEVELS.task),
+            section.getint("subtask_heading_level", DEFAULT_HEADING_LEVELS.subtask))
+
     def _get_workflow_level_heading(self):
-        return Heading1
+        return HEADING_CLASSES[self.heading_levels.workflow]
 
     def _get_task_level_heading(self):
-        return Heading4
+        return HEADING_CLASSES[self.heading_levels.task]
 
     def _get_subtask_level_heading(self):
-        return eval("Heading%d" % (self._get_task_level_heading().level + 1))
-
-    def _process_markdown_node(self, node, head=None, override_workflow_name=None):
-        # reference to currently processed task
-        for nd in node.nodes:
-            self.logger.debug("Processing node %s (HEAD: %s) - %s" %
-                              (nd.__class__.__name__, repr(head), str(head).strip()[20:]))
-            # E.g This wouldb be an epic in JIRA
-            if isinstance(nd, self._get_workflow_level_heading()):
-                # if head:
-                #    head.publish()
-                # Section overrides the
-                if override_workflow_name:
-                    self.logger.debug("Overriding heading value '%s' with section name '%s' " % (
-                        nd, override_workflow_name))
-                head = self.new_task(summary=override_workflow_name or nd.text)
-                self.add_task(head)  # Epics live on toplevel
-
-            elif isinstance(nd, self._get_task_level_heading()):
-                # if head:
-                #    head.publish()
-                # in case that workflow file has no Workflow level identifier (no H1)
-                if head == None and override_workflow_name:
-                    self.logger.debug(
-                        "Workflow level heading is missing. Using %s for workflow name" % override_workflow_name)
-                    head = self.new_task(summary=override_workflow_name)
-                    self.add_task(head)
-                    head.publish()
-                elif head == None:
-                    raise ValueError(
-                        ".md file doesn't have Workflow level heading and override_workflow_name was not supplied")
+        return HEADING_CLASSES[self.heading_levels.subtask]
 
-                head = head.parent_by_subclass(GenericWorkflow)
-                head.publish()
-                task = head.new_task(summary=nd.text)
-                # Head should be in this case one of self.tasks / workflow level
-                head.add_task(task)
-                head = task
+    def _compile_markdown_events(self, events):
+        """
+        Args
+            events (iterable) - (event, node) tuples e.g. from MarkDown.iterevents()
 
-            # make sure that this gets processed before Paragraph
-            elif isinstance(nd, Variable):
-                if not head:
-                    self.logger.error(
-                        "Identified markdown variable, but no preceeding heading or ask definition. Is this a valid markdown?")
-                else:
-                    self._process_markdown_variable(nd, head)
+        Returns WorkflowTemplate
 
-            elif isinstance(nd, Paragraph):
-                # Skip any initial text until we really found heading
-                # keep in mind that this applies also for Heading1 / Workflow
-                head.description = nd.text
-                self.logger.debug("Identified paragraph node. %s, (%s...)" % (
-                    nd, nd.text[:20].strip()))
-                head.publish()
-            elif isinstance(nd, self._get_subtask_level_heading()):
-                # head.publish() # call after all attr gathering is done
-                # Add task under Workflow
-                while not issubclass(type(head), GenericNestedTask):
-                    head = head.parent_task
-                task = head.new_task(summary=nd.text)
-                # Head should be in this case one of self.tasks / workflow level
-                head.add_task(task)
-                head = task
+        Headings and Variables are processed on EVENT_START, Paragraphs on EVENT_END
+        once their whole text is known.
+        """
+        heading_levels = self.heading_levels
+        ops = []
+        variables = {}  # task index -> variables shared by all instances of the task
+        # index of currently processed task per nesting level [head, level_has_nodes]
+        stack = [[None, False]]
+        tasks = 0
+        for event, nd in events:
+            if event == EVENT_START:
+                frame = stack[-1]
+                frame[1] = True
+                if not isinstance(nd, Paragraph):
+                    frame[0], tasks = self._compile_markdown_object(
+                        nd, frame[0], tasks, ops, variables, len(stack) == 1, heading_levels)
+                stack.append([frame[0], False])
             else:
-                self.logger.debug("handler for node %s. Skipping" % nd)
-
-            if nd.nodes:
-                self._process_markdown_node(nd, head)
+                child_frame = stack.pop()
+                if isinstance(nd, Paragraph):
+                    stack[-1][0], tasks = self._compile_markdown_object(
+                        nd, stack[-1][0], tasks, ops, variables, heading_levels=heading_levels)
+                # all child nodes of nd were processed
+                if child_frame[1] and child_frame[0] is not None:
+                    ops.append((WorkflowTemplate.PUBLISH, child_frame[0]))
+
+        if stack[0][0] is not None:
+            ops.append((WorkflowTemplate.PUBLISH, stack[0][0]))
+        return WorkflowTemplate(ops)
+
+    def _compile_markdown_object(self, nd, head, tasks, ops, variables, top_level=False, heading_levels=None):
+        """
+        Args
+            nd (MarkDownObject) - a single node e.g. Heading4
+            head (int) - index of currently processed task or None
+            tasks (int) - number of tasks created by ops
+            ops (list) - operations of WorkflowTemplate, new ones are appended
+            variables (dict) - task index -> dict of variables
+            top_level=False (bool) - the workflow name can be overridden for top level nodes
+            heading_levels=None (HeadingLevels) - self.heading_levels if None
+
+        Returns tuple (head, tasks) after processing of nd
+        """
+        self.logger.debug("Compiling node %s (HEAD: %s)" % (nd.__class__.__name__, head))
+        role = (heading_levels or self.heading_levels).role(nd)
+        # E.g This wouldb be an epic in JIRA
+        if role == HeadingLevels.WORKFLOW:
+            # Section name overrides the heading value
+            ops.append((WorkflowTemplate.NEW_WORKFLOW, None, nd.text, top_level))
+            head, tasks = tasks, tasks + 1
+
+        elif role == HeadingLevels.TASK:
+            # in case that workflow file has no Workflow level identifier (no H1)
+            if head is None:
+                ops.append((WorkflowTemplate.NEW_NAMED_WORKFLOW, None))
+                head, tasks = tasks, tasks + 1
+            ops.append((WorkflowTemplate.NEW_TASK, head, nd.text))
+            head, tasks = tasks, tasks + 1
+
+        # make sure that this gets processed before Paragraph
+        elif isinstance(nd, Variable):
+            if head is None:
+                self.logger.error(
+                    "Identified markdown variable, but no preceeding heading or ask definition. Is this a valid markdown?")
+            else:
+                self._compile_markdown_variable(nd, head, ops, variables)
 
-        if head and not head._published:
-            head.publish()  # call after all attr gathering is done
+        elif isinstance(nd, Paragraph):
+            # Skip any initial text until we really found heading
+            # keep in mind that this applies also for Heading1 / Workflow
+            if head is not None:
+                ops.append((WorkflowTemplate.DESCRIPTION, head, nd.text.strip()))
+                self.logger.debug("Identified paragraph node. %s, (%s...)" % (
+                    nd, nd.text[:20].strip()))
+        elif role == HeadingLevels.SUBTASK:
+            if head is None:
+                raise ValueError(
+                    ".md file doesn't have Workflow or Task level heading before %s" % nd.text)
+            ops.append((WorkflowTemplate.NEW_SUBTASK, head, nd.text))
+            head, tasks = tasks, tasks + 1
+        else:
+            self.logger.debug("handler for node %s. Skipping" % nd)
+        return head, tasks
 
-    def _process_markdown_variable(self, variable, task):
+    def _compile_markdown_variable(self, variable, head, ops, variables):
         """
         Args
             variable (Variable)
-            task (GenericTask) - a task which will shall contain the variable
+            head (int) - index of a task which will shall contain the variable
+            ops (list) - operations of WorkflowTemplate, new ones are appended
+            variables (dict) - task index -> dict of variables
         """
         self.logger.debug("Processing task variable %s" % variable)
 
         # substitute product in variable value (e.g. for calendar entries)
         # at this point we don't really know the Epic relation so just product/project
-        variable.value = variable.value.replace("${Project}", self.conf["project"]["name"])
-        variable.value = variable.value.replace("${Product}", self.conf["project"]["name"])
+        # variable itself is not modified as parsed documents can be shared by multiple workflows
+        value = template.render(variable.value, template.project_context(self.conf))
 
         # Is it a relation?
         if self._variable_is_relation(variable):
-            # Links in between tasks are defined in Workflow level object
-            head = task.parent_by_subclass(GenericWorkflow)
-
-            inbound = False
-            for inbound_relation in self.environment["TaskRelations"]['inbound'].split(','):
-                if variable.name == inbound_relation.strip():
-                    inbound = True
-
-                t = None
-                s = None
-                if inbound:
-                    t = task
-                    s = self.get_task_or_placeholder_by_summary(variable.value)
-                else:
-                    s = task
-                    t = self.get_task_or_placeholder_by_summary(variable.value)
-
-            assert t != None
-            assert s != None
-            self.logger.info(
-                "Adding relation from a task definition from %s to %s" % (s, t))
-            head.add_task_relation(
-                TaskRelation(
-                    relation_name=variable.name,
-                    parent=self,
-                    source=s,
-                    target=t  # At this point the task is most likely not yet created, store name reference instead
-                )
-            )
+            ops.append((WorkflowTemplate.RELATION, head, variable.name, value))
         elif self._variable_is_calendar(variable):
-            schedule = task.parent_by_subclass(GenericProject).schedule
-            self.logger.debug("Looking up calendar entry for '%s'" % variable.value)
-            task.calendar_entry = schedule.start_end_by_name(variable.value)
-            if task.calendar_entry:
-                self.logger.debug("Found calendar entry %s: %s" % (variable.value, task.calendar_entry))
+            ops.append((WorkflowTemplate.CALENDAR, head, value))
         else:
             self.logger.debug(
                 "Task variable %s was not processed at parsing" % variable)
-            task.add_variable(variable.name, variable.value)
+            if head not in variables:
+                variables[head] = {}
+                ops.append((WorkflowTemplate.VARIABLES, head, MappingProxyType(variables[head])))
+            variables[head][variable.name] = value
+
+    def _instantiate_workflow_template(self, workflow_template, override_workflow_name=None):
+        """
+        Args
+            workflow_template (WorkflowTemplate)
+            override_workflow_name=None (str) - applies only to top level workflow
+
+        Creates tasks of the template under this project. Summaries, descriptions and variables
+        are shared with other instances of the template.
+        """
+        tasks = []
+        for op in workflow_template.ops:
+            code = op[0]
+            head = tasks[op[1]] if op[1] is not None else None
+
+            if code == WorkflowTemplate.PUBLISH:
+                if not head._published:
+                    head.publish()  # call after all attr gathering is done
+
+            elif code == WorkflowTemplate.NEW_WORKFLOW:
+                summary = op[2]
+                if op[3] and override_workflow_name:
+                    self.logger.debug("Overriding heading value '%s' with section name '%s' " % (
+                        summary, override_workflow_name))
+                    summary = override_workflow_name
+                task = self.new_task(summary=summary)
+                self.add_task(task)  # Epics live on toplevel
+                tasks.append(task)
+
+            elif code == WorkflowTemplate.NEW_NAMED_WORKFLOW:
+                if not override_workflow_name:
+                    raise ValueError(
+                        ".md file doesn't have Workflow level heading and override_workflow_name was not supplied")
+                self.logger.debug(
+                    "Workflow level heading is missing. Using %s for workflow name" % override_workflow_name)
+                task = self.new_task(summary=override_workflow_name)
+                self.add_task(task)
+                task.publish()
+                tasks.append(task)
+
+            elif code == WorkflowTemplate.NEW_TASK:
+                head = head.parent_by_subclass(GenericWorkflow)
+                head.publish()
+                task = head.new_task(summary=op[2])
+                # Head should be in this case one of self.tasks / workflow level
+                head.add_task(task)
+                tasks.append(task)
+
+            elif code == WorkflowTemplate.NEW_SUBTASK:
+                # Add task under the nearest task supporting nesting
+                while not issubclass(type(head), GenericNestedTask):
+                    head = head.parent_task
+                task = head.new_task(summary=op[2])
+                head.add_task(task)
+                tasks.append(task)
+
+            elif code == WorkflowTemplate.VARIABLES:
+                head._variables = op[2]
+                head._owner_resolved = False
+
+            elif code == WorkflowTemplate.DESCRIPTION:
+                head.description = op[2]
+                head.publish()
+
+            elif code == WorkflowTemplate.RELATION:
+                self._add_task_relation_from_variable(head, op[2], op[3])
+
+            elif code == WorkflowTemplate.CALENDAR:
+                schedule = head.parent_by_subclass(GenericProject).schedule
+                self.logger.debug("Looking up calendar entry for '%s'" % op[2])
+                head.calendar_entry = schedule.start_end_by_name(op[2])
+                if head.calendar_entry:
+                    self.logger.debug("Found calendar entry %s: %s" % (op[2], head.calendar_entry))
+
+    def _add_task_relation_from_variable(self, task, relation_name, value):
+        """
+        Args
+            task (GenericTask) - a task which contains the relation variable
+            relation_name (str) - variable name e.g. Blocks
+            value (str) - summary of the other task
+        """
+        # Links in between tasks are defined in Workflow level object
+        head = task.parent_by_subclass(GenericWorkflow)
+
+        if self.relation_schema.is_inbound(relation_name):
+            t = task
+            s = self.get_task_or_placeholder_by_summary(value, workflow=head)
+        else:
+            s = task
+            t = self.get_task_or_placeholder_by_summary(value, workflow=head)
+
+        assert t != None
+        assert s != None
+        self.logger.info(
+            "Adding relation from a task definition from %s to %s" % (s, t))
+        head.add_task_relation(
+            TaskRelation(
+                relation_name=relation_name,
+                parent=self,
+                source=s,
+                target=t  # At this point the task is most likely not yet created, store name reference instead
+            )
+        )
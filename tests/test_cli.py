@@ -16,6 +16,36 @@ def test_validate_example_config():
     assert not cli.Cli.validate_config(config)
 
 
+def test_markdown_cache_config(tmpdir):
+    config = configparser.ConfigParser()
+    config.read(cli.DEFAULT_CONFIG_PATH)
+    assert cli.Cli(config).markdown_cache.cache_dir is None
+
+    config.read_string(u"""
+    [cache]
+    markdown = True
+    markdown_max_size = 2
+    directory = %s
+    """ % tmpdir)
+    assert not cli.Cli.validate_config(config)
+    cache = cli.Cli(config).markdown_cache
+    assert cache.cache_dir == str(tmpdir)
+    assert cache.max_size == 2 * 1024 * 1024
+
+    config["cache"]["markdown_max_size"] = "lots"
+    assert cli.Cli.validate_config(config)
+    config["cache"]["markdown_max_size"] = "2"
+
+    client = cli.Cli(config)
+    assert client.persistent_cache_dir("jira_fields") is None
+    config["cache"]["jira_fields"] = "True"
+    config["cache"]["jira_fields_ttl"] = "12"
+    assert not cli.Cli.validate_config(config)
+    assert client.persistent_cache_dir("jira_fields") == str(tmpdir)
+    config["cache"]["jira_fields_ttl"] = "a day"
+    assert cli.Cli.validate_config(config)
+
+
 def test_validate_example_project():
     config = configparser.ConfigParser()
     config.read(os.path.join(cli.EXAMPLE_DIR, "my_project.conf"))
@@ -24,6 +54,22 @@ def test_validate_example_project():
     assert not cli.Cli.validate_project(config)
 
 
+def test_validate_project_heading_levels():
+    config = configparser.ConfigParser()
+    config.read_string(u"""
+    [project]
+    name = Test Project
+    workflow_heading_level = 2
+    task_heading_level = 3
+    """)
+    assert not cli.Cli.validate_project(config)
+
+    config["project"]["subtask_heading_level"] = "3"
+    assert cli.Cli.validate_project(config)
+    config["project"]["subtask_heading_level"] = "7"
+    assert cli.Cli.validate_project(config)
+
+
 def test_handle_local_project():
     config = configparser.ConfigParser()
     config.read(cli.DEFAULT_CONFIG_PATH)
@@ -26,3 +26,19 @@ def test_beta_example_generic_backend():
 
     # Essentially just shouldn't crash
     client.handle_project(os.path.join(cli.EXAMPLE_DIR, "release-checklist", "my_project.conf"))
+
+
+def test_example_project_parses_markdown_once():
+    environment = configparser.ConfigParser()
+    environment.read(os.path.join(cli.DEFAULT_CONFIG_DIR, "local.conf"))
+
+    client = cli.Cli(environment, cli.CliAction.CREATE)
+    client.handle_project(os.path.join(cli.EXAMPLE_DIR, "my_project.conf"))
+
+    # repetitiveTasksForMilestones.md is referenced by four sections
+    project_conf = client.project_conf
+    filenames = [project_conf[s]["markdown_filename"] for s in project_conf.sections()
+                 if "markdown_filename" in project_conf[s]]
+    assert len(filenames) > len(set(filenames))
+    assert client.markdown_cache.misses == len(set(filenames))
+    assert client.markdown_cache.hits == len(filenames) - len(set(filenames))
@@ -70,3 +70,538 @@ def test_bold_description():
 
     subtask.description = "This is a __Bold__ text"
     assert subtask.description == "This is a *Bold* text" # Jira uses single star
+
+
+def test_task_relations_published_once():
+    environment_config = u"""
+    [TaskRelations]
+    relations = Blocks, Depends On, Implements, Implemented by
+    inbound = Implemented by, Depends On
+
+    [JiraTaskRelations]
+    Blocks = Blocks
+    Depends On = Blocks
+    Implements = Implements
+    Implemented by = Implements
+
+    [jira]
+    relative_link_topurl = http://localhost
+    server = http://localhost
+    project = Test
+    mapping_JiraSubTask = Sub-Task
+    mapping_JiraTask = Task
+    mapping_JiraBasedWorkflow = Epic
+    mapping_EpicName = Epic Name
+    mapping_EpicNameQuery = Epic Link
+    mapping_Assignee = Worker
+    mapping_ProjectName = Product
+    update_states = Open, Backlog
+    """
+    project_conf = u"""
+    [project]
+    name = Test Product
+
+    [Alpha]
+    # forward reference to a section which is loaded later
+    Blocks = Beta
+
+    [Beta]
+    """
+
+    class CountingJiraInstance(jirabackend.FakeJiraInstance):
+        links = []
+
+        def create_issue_link(self, relation, issue1, issue2):
+            self.links.append((relation, issue1, issue2))
+
+    project = jirabackend.JiraBasedProject("Test Product")
+    project.environment.read_string(environment_config)
+    project.conf.read_string(project_conf)
+    project.jira_session = CountingJiraInstance()
+    for section in ("Alpha", "Beta"):
+        md = markdown.MarkDown()
+        md.reads(u"#### task 1\ndescription\n#### task 2\nDepends on: task 1\ndescription")
+        project.from_markdown(md, override_workflow_name=section)
+        project.relations_from_conf_section(project.conf, section)
+
+    project.publish_task_relations()
+    project.publish_task_relations()
+    # Alpha blocks Beta + task 1 blocks task 2 in both workflows
+    assert len(CountingJiraInstance.links) == 3
+    assert project.task_relations[0].target is project.tasks[1]
+
+
+def test_description_jira_markup():
+    conf = configparser.ConfigParser()
+    conf.read_string(u"[project]\nname = Leap\n")
+    environment = configparser.ConfigParser()
+    environment.read_string(u"[jira]\nrelative_link_topurl = https://example.com/md\n")
+
+    wf = jirabackend.JiraBasedWorkflow("Beta", environment=environment, conf=conf)
+    task = jirabackend.JiraTask(
+        "task", description=u"**${Project}** __${Milestone}__ see [Alpha](alpha.md)")
+    wf.add_task(task)
+
+    assert task.description == u"*Leap* *Beta* see [Alpha|https://example.com/md/alpha.md]"
+    assert task.description is task.description
+
+
+def test_update_uses_prefetched_issues():
+    environment_config = u"""
+    [jira]
+    server = http://localhost
+    project = T
+    mapping_JiraSubTask = Sub-Task
+    mapping_JiraTask = Task
+    mapping_JiraBasedWorkflow = Epic
+    mapping_EpicName = Epic Name
+    mapping_EpicNameQuery = Epic Link
+    mapping_Assignee = Worker
+    mapping_ProjectName = Product
+    update_states = Open, Backlog
+    epic_update_states = Open, Backlog, In Progress
+    """
+
+    class Fields(object):
+        def __init__(self, **kwargs):
+            self.__dict__.update(kwargs)
+
+    class SearchedIssue(object):
+        def __init__(self, key, issuetype, summary, description, epic=None, parent=None):
+            self.key = self.id = key
+            self.fields = Fields(issuetype=Fields(name=issuetype), summary=summary, description=description,
+                                 status="Open", customfield_12301=epic, parent=parent)
+            self.updates = []
+
+        def update(self, fields):
+            self.updates.append(fields["description"])
+
+    epic = SearchedIssue("T-1", "Epic", "Alpha", "")
+    task = SearchedIssue("T-2", "Task", "task 1", "description", epic="T-1")
+    subtask = SearchedIssue("T-3", "Sub-Task", "sub 1", "old sub description", parent=task)
+    # the same summary in a different epic
+    other = SearchedIssue("T-9", "Task", "task 1", "description", epic="T-8")
+
+    class SearchingJiraInstance(jirabackend.FakeJiraInstance):
+        searches = []
+
+        def search_issues(self, query, startAt=0, maxResults=50):
+            self.searches.append((query, startAt))
+            return [epic, task, other, subtask][startAt:startAt + maxResults]
+
+        def create_issue(self, fields):
+            raise AssertionError("Unexpected create of %s" % fields)
+
+        def add_issues_to_epic(self, epic_id, issue_keys, ignore_epics=True):
+            # task 1 already has Epic Link T-1
+            raise AssertionError("Unexpected add of %s to epic %s" % (issue_keys, epic_id))
+
+    project = jirabackend.JiraBasedProject("Test Product")
+    project.environment.read_string(environment_config)
+    project.conf.read_string(u"[project]\nname = Test Product\n")
+    project.jira_session = SearchingJiraInstance()
+    project.set_action(cli.CliAction.UPDATE)
+    project.prefetch_issues(page_size=2)
+    assert SearchingJiraInstance.searches == [
+        ('project=T AND Product ~ "Test Product"', 0),
+        ('project=T AND Product ~ "Test Product"', 2),
+        ('project=T AND Product ~ "Test Product"', 4)]
+    assert len(project.issue_index) == 4
+
+    md = markdown.MarkDown()
+    md.reads(u"#### task 1\ndescription\n##### sub 1\nsub description")
+    project.from_markdown(md, override_workflow_name="Alpha")
+    project.publish_queued_issues()
+
+    assert len(SearchingJiraInstance.searches) == 3
+    assert project.tasks[0]._issue is epic
+    assert project.tasks[0].tasks[0]._issue is task
+    assert project.tasks[0].tasks[0].tasks[0]._issue is subtask
+    assert not task.updates and subtask.updates == ["sub description"]
+
+
+def test_prefetch_issues_short_pages():
+    class Fields(object):
+        def __init__(self, **kwargs):
+            self.__dict__.update(kwargs)
+
+    class SearchedIssue(object):
+        def __init__(self, key):
+            self.key = self.id = key
+            self.fields = Fields(issuetype=Fields(name="Task"), summary="task %s" % key, parent=None)
+
+    class ResultList(list):  # as jira.client.ResultList
+        total = 7
+
+    class CappedJiraInstance(jirabackend.FakeJiraInstance):
+        searches = []
+
+        def search_issues(self, query, startAt=0, maxResults=50):
+            self.searches.append(startAt)
+            # server caps maxResults at 3
+            return ResultList(SearchedIssue("T-%d" % i) for i in range(startAt, min(startAt + 3, 7)))
+
+    project = jirabackend.JiraBasedProject("Test Product")
+    project.environment.read_string(u"[jira]\nserver = http://localhost\nproject = T\n")
+    project.conf.read_string(u"[project]\nname = Test Product\n")
+    project.jira_session = CappedJiraInstance()
+    project.prefetch_issues(page_size=5)
+    assert CappedJiraInstance.searches == [0, 3, 6]
+    assert len(project.issue_index) == 7
+
+
+def test_update_creates_new_issues():
+    environment_config = u"""
+    [jira]
+    server = http://localhost
+    project = T
+    mapping_JiraSubTask = Sub-Task
+    mapping_JiraTask = Task
+    mapping_JiraBasedWorkflow = Epic
+    mapping_EpicName = Epic Name
+    mapping_EpicNameQuery = Epic Link
+    mapping_Assignee = Worker
+    update_states = Open
+    epic_update_states = Open
+    create_batch_size = 2
+    """
+
+    class CreatedIssue(object):  # as returned by create_issues(prefetch=False), without fields
+        def __init__(self, id):
+            self.id = u"%s" % id
+            self.key = u"T-%s" % id
+
+    class UpdatingJiraInstance(jirabackend.FakeJiraInstance):
+        created = []
+
+        def search_issues(self, query, startAt=0, maxResults=50):
+            return []
+
+        def create_issue(self, fields):
+            self.created.append(fields["summary"])
+            return CreatedIssue(self._next_id())
+
+        def create_issues(self, field_list, prefetch=True):
+            return [{"status": "Success", "issue": self.create_issue(fields), "error": None,
+                     "input_fields": fields} for fields in field_list]
+
+    project = jirabackend.JiraBasedProject("Test Product")
+    project.environment.read_string(environment_config)
+    project.conf.read_string(u"[project]\nname = Test Product\n")
+    project.jira_session = UpdatingJiraInstance()
+    project.set_action(cli.CliAction.UPDATE)
+    project.prefetch_issues()
+
+    md = markdown.MarkDown()
+    md.reads(u"#### task 1\ndescription\n##### sub 1\nsub\n#### task 2\ndescription\n##### sub 2\nsub")
+    project.from_markdown(md, override_workflow_name="Alpha")
+    assert not project.publish_queued_issues()
+    assert sorted(UpdatingJiraInstance.created) == ["Alpha", "sub 1", "sub 2", "task 1", "task 2"]
+
+
+def test_create_issues_in_batches():
+    environment_config = u"""
+    [jira]
+    server = http://localhost
+    project = T
+    mapping_JiraSubTask = Sub-Task
+    mapping_JiraTask = Task
+    mapping_JiraBasedWorkflow = Epic
+    mapping_EpicName = Epic Name
+    mapping_EpicNameQuery = Epic Link
+    mapping_Assignee = Worker
+    create_batch_size = 2
+    """
+
+    class BulkJiraInstance(jirabackend.FakeJiraInstance):
+        batches = []
+
+        def create_issue(self, fields):
+            if fields["summary"] == "task 2":
+                raise AssertionError("Issues are expected to be created in bulk")
+            return super(BulkJiraInstance, self).create_issue(fields)
+
+        def create_issues(self, field_list, prefetch=True):
+            self.batches.append([fields["summary"] for fields in field_list])
+            results = []
+            for fields in field_list:
+                if fields["summary"] == "task 2":
+                    results.append({"status": "Error", "issue": None, "error": {"summary": "invalid"},
+                                    "input_fields": fields})
+                else:
+                    results.append({"status": "Success", "issue": self.create_issue(fields), "error": None,
+                                    "input_fields": fields})
+            return results
+
+    project = jirabackend.JiraBasedProject("Test Product")
+    project.environment.read_string(environment_config)
+    project.conf.read_string(u"[project]\nname = Test Product\n")
+    project.jira_session = BulkJiraInstance()
+    md = markdown.MarkDown()
+    md.reads(u"#### task 1\ndescription\n##### sub 1\nsub\n#### task 2\ndescription\n##### sub 2\nsub\n"
+             u"#### task 3\ndescription")
+    project.from_markdown(md, override_workflow_name="Alpha")
+    assert BulkJiraInstance.batches == []
+
+    assert project.publish_queued_issues() == 2  # task 2 and its sub task
+    assert BulkJiraInstance.batches == [["Alpha"], ["task 1", "task 2"], ["task 3"], ["sub 1"]]
+    tasks = project.tasks[0].tasks
+    assert tasks[0]._issue and tasks[2]._issue and tasks[0].tasks[0]._issue
+    assert tasks[1]._issue is None and tasks[1].tasks[0]._issue is None
+
+
+def test_create_issues_one_by_one_failure():
+    import jira
+
+    environment_config = u"""
+    [jira]
+    server = http://localhost
+    project = T
+    mapping_JiraSubTask = Sub-Task
+    mapping_JiraTask = Task
+    mapping_JiraBasedWorkflow = Epic
+    mapping_EpicName = Epic Name
+    mapping_Assignee = Worker
+    create_batch_size = 1
+    max_workers = 2
+    """
+
+    class FailingJiraInstance(jirabackend.FakeJiraInstance):
+        def create_issue(self, fields):
+            if fields["summary"] == "task 2":
+                raise jira.JIRAError("invalid summary", status_code=400)
+            return super(FailingJiraInstance, self).create_issue(fields)
+
+    project = jirabackend.JiraBasedProject("Test Product")
+    project.environment.read_string(environment_config)
+    project.conf.read_string(u"[project]\nname = Test Product\n")
+    project.jira_session = FailingJiraInstance()
+    md = markdown.MarkDown()
+    md.reads(u"#### task 1\ndescription\n##### sub 1\nsub\n#### task 2\ndescription\n##### sub 2\nsub\n"
+             u"#### task 3\ndescription")
+    project.from_markdown(md, override_workflow_name="Alpha")
+    try:
+        # same as failed items of create_issues(), see test_create_issues_in_batches
+        assert project.publish_queued_issues() == 2
+    finally:
+        project.publisher.shutdown()
+    tasks = project.tasks[0].tasks
+    assert tasks[0]._issue and tasks[2]._issue and tasks[0].tasks[0]._issue
+    assert tasks[1]._issue is None and tasks[1].tasks[0]._issue is None
+
+
+def test_add_to_epic_in_batches():
+    environment_config = u"""
+    [jira]
+    server = http://localhost
+    project = T
+    mapping_JiraSubTask = Sub-Task
+    mapping_JiraTask = Task
+    mapping_JiraBasedWorkflow = Epic
+    mapping_EpicName = Epic Name
+    mapping_Assignee = Worker
+    """
+
+    class EpicJiraInstance(jirabackend.FakeJiraInstance):
+        epics = []
+
+        def add_issues_to_epic(self, epic_id, issue_keys, ignore_epics=True):
+            self.epics.append((epic_id, issue_keys))
+
+    project = jirabackend.JiraBasedProject("Test Product")
+    project.environment.read_string(environment_config)
+    project.conf.read_string(u"[project]\nname = Test Product\n")
+    project.jira_session = EpicJiraInstance()
+    md = markdown.MarkDown()
+    md.reads(u"\n".join(u"#### task %d\ndescription\n##### sub %d\nsub" % (i, i)
+                        for i in range(jirabackend.EPIC_BATCH_SIZE + 1)))
+    for section in ("Alpha", "Beta"):
+        project.from_markdown(md, override_workflow_name=section)
+    project.publish_queued_issues()
+
+    # sub tasks are not added to epics
+    alpha, beta = [workflow._issue.id for workflow in project.tasks]
+    assert [(epic_id, len(keys)) for epic_id, keys in EpicJiraInstance.epics] == [
+        (alpha, jirabackend.EPIC_BATCH_SIZE), (alpha, 1), (beta, jirabackend.EPIC_BATCH_SIZE), (beta, 1)]
+    assert EpicJiraInstance.epics[0][1][0] == project.tasks[0].tasks[0]._issue.id
+
+
+def test_publisher_keeps_order():
+    import time
+
+    publisher = jirabackend.JiraPublisher(max_workers=4)
+    try:
+        # later items finish first
+        assert publisher.map(lambda i: time.sleep((5 - i) * 0.01) or i * i, range(5)) == [0, 1, 4, 9, 16]
+    finally:
+        publisher.shutdown()
+
+
+def test_concurrent_publishing_matches_sequential():
+    environment_config = u"""
+    [TaskRelations]
+    relations = Blocks, Depends On
+    inbound = Depends On
+
+    [JiraTaskRelations]
+    Blocks = Blocks
+    Depends On = Blocks
+
+    [jira]
+    server = http://localhost
+    project = T
+    mapping_JiraSubTask = Sub-Task
+    mapping_JiraTask = Task
+    mapping_JiraBasedWorkflow = Epic
+    mapping_EpicName = Epic Name
+    mapping_EpicNameQuery = Epic Link
+    mapping_Assignee = Worker
+    create_batch_size = 1
+    """
+    raw = u"\n".join(u"#### task %d\nDepends on: task %d\n\ndescription\n##### sub %d\nsub" % (i, i - 1, i)
+                     for i in range(1, 20))
+    raw = u"#### task 0\ndescription\n" + raw
+
+    def publish(max_workers):
+        class RecordingJiraInstance(jirabackend.FakeJiraInstance):
+            def __init__(self):
+                super(RecordingJiraInstance, self).__init__()
+                self.summaries = {}
+                self.links = []
+                self.epics = []
+
+            def create_issue(self, fields):
+                parent = fields.get("parent")
+                # parent has to be created first
+                assert parent is None or parent["id"] in self.summaries
+                issue = super(RecordingJiraInstance, self).create_issue(fields)
+                self.summaries[issue.id] = fields["summary"]
+                return issue
+
+            def add_issues_to_epic(self, epic_id, issue_keys, ignore_epics=True):
+                self.epics.extend((self.summaries[epic_id], self.summaries[key]) for key in issue_keys)
+
+            def create_issue_link(self, relation, issue1, issue2):
+                self.links.append((relation, issue1, issue2))
+
+        project = jirabackend.JiraBasedProject("Test Product")
+        project.environment.read_string(environment_config)
+        project.environment["jira"]["max_workers"] = str(max_workers)
+        project.conf.read_string(u"[project]\nname = Test Product\n")
+        project.jira_session = RecordingJiraInstance()
+        md = markdown.MarkDown()
+        md.reads(raw)
+        for section in ("Alpha", "Beta"):
+            project.from_markdown(md, override_workflow_name=section)
+        project.publish_task_relations()
+        project.publisher.shutdown()
+
+        session = project.jira_session
+        keys = dict((key, session.summaries[key.split("-")[1]]) for key in
+                    ("T-%s" % i for i in session.summaries))
+        # requests of the same level may finish in any order
+        return (sorted(session.summaries.values()), sorted(session.epics),
+                sorted((relation, keys[a], keys[b]) for relation, a, b in session.links))
+
+    assert publish(1) == publish(4)
+
+
+def test_field_registry(tmpdir):
+    class CountingJiraInstance(jirabackend.FakeJiraInstance):
+        calls = 0
+
+        def fields(self):
+            CountingJiraInstance.calls += 1
+            fields = super(CountingJiraInstance, self).fields()
+            if CountingJiraInstance.calls > 1:
+                fields.append({"id": "customfield_99999", "name": "New Field"})
+            return fields
+
+    session = CountingJiraInstance()
+    registry = jirabackend.JiraFieldRegistry("http://localhost", cache_dir=str(tmpdir))
+    assert registry.field_id(session, "Epic Link") == "customfield_12301"
+    assert registry.field_id(session, "customfield_12301") == "customfield_12301"
+    assert registry.field_id(session, "summary") == "summary"
+    # fields were fetched during this run, so an unknown field is not fetched again
+    assert registry.field_id(session, "New Field") is None
+    assert CountingJiraInstance.calls == 1
+
+    # next run uses stored fields and stored unknown names, a new unknown field refreshes them
+    registry = jirabackend.JiraFieldRegistry("http://localhost", cache_dir=str(tmpdir))
+    assert registry.field_id(session, "Epic Link") == "customfield_12301"
+    assert registry.field_id(session, "New Field") is None
+    assert registry.field_id(session, "parent") == "parent"
+    assert CountingJiraInstance.calls == 1
+    assert registry.field_id(session, "Other Field") is None
+    assert registry.field_id(session, "New Field") == "customfield_99999"
+    assert CountingJiraInstance.calls == 2
+
+    # stored fields are per server and expire
+    registry = jirabackend.JiraFieldRegistry("http://otherhost", cache_dir=str(tmpdir))
+    registry.field_id(session, "Epic Link")
+    assert CountingJiraInstance.calls == 3
+    registry = jirabackend.JiraFieldRegistry("http://localhost", cache_dir=str(tmpdir), ttl=-1)
+    registry.field_id(session, "Epic Link")
+    assert CountingJiraInstance.calls == 4
+
+
+def test_field_registry_warm_cache(tmpdir):
+    environment_config = u"""
+    [jira]
+    server = http://fields.localhost
+    project = T
+    mapping_JiraSubTask = Sub-Task
+    mapping_JiraTask = Task
+    mapping_JiraBasedWorkflow = Epic
+    mapping_EpicName = Epic Name
+    mapping_Assignee = Worker
+    """
+
+    class CountingJiraInstance(jirabackend.FakeJiraInstance):
+        calls = 0
+
+        def fields(self):
+            CountingJiraInstance.calls += 1
+            return super(CountingJiraInstance, self).fields()
+
+    def publish():
+        project = jirabackend.JiraBasedProject("Test Product")
+        project.field_registry = jirabackend.JiraFieldRegistry("http://fields.localhost", cache_dir=str(tmpdir))
+        project.environment.read_string(environment_config)
+        project.conf.read_string(u"[project]\nname = Test Product\n")
+        project.jira_session = CountingJiraInstance()
+        md = markdown.MarkDown()
+        md.reads(u"#### task 1\ndescription\n##### sub 1\nsub")
+        project.from_markdown(md, override_workflow_name="Alpha")
+        project.publish_queued_issues()
+        assert project.tasks[0].tasks[0].tasks[0]._issue
+
+    publish()
+    assert CountingJiraInstance.calls == 1
+    # sub tasks (parent) and unknown mapping_Assignee don't refresh stored fields
+    publish()
+    assert CountingJiraInstance.calls == 1
+
+
+def test_field_registry_from_cli(tmpdir):
+    environment_config = u"""
+    [jira]
+    server = http://localhost
+
+    [cache]
+    jira_fields = True
+    jira_fields_ttl = 12
+    directory = %s
+    """ % tmpdir
+    environment = configparser.ConfigParser()
+    environment.read_string(environment_config)
+    registry = jirabackend.field_registry_from_cli(cli.Cli(environment))
+    assert (registry.cache_dir, registry.ttl) == (str(tmpdir), 12 * 60 * 60)
+
+    # settings of one run don't leak into the next one
+    del environment["cache"]["jira_fields_ttl"]
+    other = jirabackend.field_registry_from_cli(cli.Cli(environment))
+    assert other is not registry
+    assert (other.cache_dir, other.ttl) == (str(tmpdir), jirabackend.DEFAULT_FIELDS_TTL)
+    environment.remove_section("cache")
+    assert jirabackend.field_registry_from_cli(cli.Cli(environment)).cache_dir is None
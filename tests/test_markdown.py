@@ -1,8 +1,14 @@
 # -*- coding: utf-8 -*-
 
+import os
 import pytest
 import md2workflow.markdown as markdown
 
+try:
+    from io import StringIO
+except ImportError:
+    from StringIO import StringIO
+
 
 def test_heading_fm():
     for x in (1, 4, 5):  # 1..6
@@ -187,3 +193,248 @@ def test_process_subtask():
     assert len(md.nodes[0].nodes[0].nodes[1].nodes) == 1 and isinstance(
         md.nodes[0].nodes[0].nodes[1].nodes[0], markdown.Paragraph)
     assert not md.nodes[0].nodes[0].nodes[1].nodes[0].nodes
+
+
+def test_tokenizer():
+    tokenizer = markdown.LineTokenizer()
+    token = tokenizer.tokenize("#### test task")
+    assert token.kind == markdown.Token.HEADING
+    assert token.level == 4 and token.text == "test task"
+
+    token = tokenizer.tokenize("var 1 : value")
+    assert token.kind == markdown.Token.VARIABLE
+    assert token.value == "value"
+    assert isinstance(markdown.Variable.from_markdown(token), markdown.Variable)
+
+    # Variable-like line after a paragraph is a part of the paragraph
+    token = tokenizer.tokenize("var: value", markdown.Paragraph("text"))
+    assert token.kind == markdown.Token.PARAGRAPH
+
+    for line in ("## test h2", "####### test", "text", ""):
+        assert tokenizer.tokenize(line).kind == markdown.Token.PARAGRAPH
+
+
+def test_tokenizer_code_fence():
+    raw = "#### task\ndescription\n```\n# not a heading\n#### not a heading\n```\n#### task 2"
+    md = markdown.MarkDown()
+    md.reads(raw)
+    assert len(md.nodes) == 1
+    assert len(md.nodes[0].nodes) == 2
+    assert md.nodes[0].nodes[0].text == "description\n```\n# not a heading\n#### not a heading\n```"
+    assert md.nodes[0].nodes[1].text == "task 2"
+    assert not md._tokenizer.in_fence
+
+
+def test_paragraph_merge_buffer():
+    para = markdown.Paragraph("line")
+    para.merge(markdown.Paragraph("line2"))
+    para.merge(markdown.Paragraph("line3"))
+    assert para.text == "line\nline2\nline3"
+    para.merge(markdown.Paragraph("line4"))
+    assert str(para) == "line\nline2\nline3\nline4"
+    para.text = "replaced"
+    assert para.to_markdown() == "replaced"
+
+
+def test_reads_paragraph_after_variable():
+    raw = "#### task\nvar: value\nline\nline2\nvar2: value"
+    md = markdown.MarkDown()
+    md.reads(raw)
+    task = md.nodes[0]
+    assert len(task.nodes) == 2
+    assert isinstance(task.nodes[0], markdown.Variable)
+    assert task._paragraph is task.nodes[1]
+    assert task.nodes[1].text == "line\nline2\nvar2: value"
+
+
+def test_iterparse_events():
+    raw = u"# test h1\n#### test task\nvar: value\ndescription\nline 2\n##### test subtask\n"
+    md = markdown.MarkDown()
+    # Paragraph text is complete only on EVENT_END
+    events = [(event, node.__class__.__name__, event == markdown.EVENT_END and str(node))
+              for event, node in md.iterparse(StringIO(raw))]
+    assert events == [
+        (markdown.EVENT_START, "Heading1", False),
+        (markdown.EVENT_START, "Heading4", False),
+        (markdown.EVENT_START, "Variable", False),
+        (markdown.EVENT_END, "Variable", "var"),
+        (markdown.EVENT_START, "Paragraph", False),
+        (markdown.EVENT_END, "Paragraph", "description\n\nline 2\n"),
+        (markdown.EVENT_START, "Heading5", False),
+        (markdown.EVENT_END, "Heading5", "test subtask"),
+        (markdown.EVENT_END, "Heading4", "test task"),
+        (markdown.EVENT_END, "Heading1", "test h1"),
+    ]
+    assert not md.nodes  # ended nodes are detached
+
+
+def test_feed_matches_read():
+    raw = u"# test h1\ntext\n#### test task\nvar: value\ndescription\n```\n# code\n```\n#### task 2"
+    md = markdown.MarkDown()
+    md.read(StringIO(raw))
+    expected = [(event, str(node)) for event, node in md.iterevents()]
+
+    md = markdown.MarkDown()
+    events = []
+    for i in range(0, len(raw), 3):
+        md.feed(raw[i:i + 3])
+        events.extend(md.read_events())
+    md.close()
+    events.extend(md.read_events())
+    assert [(event, str(node)) for event, node in events] == expected
+    assert len(md.nodes) == 1  # feed() keeps the tree
+
+
+def test_read_path(tmpdir):
+    raw = u"# test h1\r\n#### test task\r\nvar: value\r\ndescription ${Project}\r\nline 2\r\n"
+    path = tmpdir.join("test.md")
+    path.write_binary(raw.encode("utf-8"))
+
+    md = markdown.MarkDown()
+    md.read_path(str(path))
+    expected = [(event, str(node)) for event, node in md.iterevents()]
+    assert md.nodes[0].nodes[0].nodes[1].text == u"description ${Project}\r\n\nline 2\r\n"
+
+    md = markdown.MarkDown()
+    md.read(markdown.MarkDown.open_file(str(path)))
+    assert [(event, str(node)) for event, node in md.iterevents()] == expected
+
+
+def test_compact_nodes():
+    md = markdown.MarkDown()
+    md.reads("# test h1\n#### test task\nvar: value\ndescription")
+    task = md.nodes[0].nodes[0]
+    for node in (md.nodes[0], task, task.nodes[0], task.nodes[1]):
+        assert not hasattr(node, "__dict__")
+    # leaf nodes share the empty nodes
+    assert task.nodes[0].nodes is task.nodes[1].nodes is markdown.EMPTY_NODES
+    assert task.nodes[0].logger is markdown.MarkDownObject.logger
+
+
+def test_markdown_cache(tmpdir):
+    path = tmpdir.join("test.md")
+    path.write(u"# test h1\n#### test task\ndescription")
+
+    cache = markdown.MarkDownCache()
+    md = cache.parse(str(path))
+    assert cache.parse(str(path)) is md
+    assert cache.parse(os.path.join(str(tmpdir), ".", "test.md")) is md
+    assert (cache.misses, cache.hits) == (1, 2)
+
+    path.write(u"# test h1\n#### changed task\ndescription")
+    changed = cache.parse(str(path))
+    assert changed is not md
+    assert changed.nodes[0].nodes[0].text == "changed task"
+
+
+def test_markdown_cache_encoding(tmpdir):
+    path = tmpdir.join("test.md")
+    path.write_binary(u"# test h1\n#### caf\u00e9\ndescription".encode("utf-8"))
+    cache_dir = str(tmpdir.join("cache"))
+
+    cache = markdown.MarkDownCache(cache_dir=cache_dir)
+    utf8 = cache.parse(str(path))
+    latin1 = cache.parse(str(path), encoding="latin-1")
+    assert latin1 is not utf8
+    assert utf8.nodes[0].nodes[0].text == u"caf\u00e9"
+    assert latin1.nodes[0].nodes[0].text == u"caf\u00c3\u00a9"
+    # encoding names are normalized
+    assert cache.parse(str(path), encoding="UTF8") is utf8
+    assert len(os.listdir(cache_dir)) == 2
+
+    warm = markdown.MarkDownCache(cache_dir=cache_dir)
+    assert warm.parse(str(path), encoding="latin-1").nodes[0].nodes[0].text == u"caf\u00c3\u00a9"
+    assert warm.disk_hits == 1
+
+
+def test_compact_roundtrip():
+    md = markdown.MarkDown()
+    md.reads(u"# test h1\n#### task\nResponsible: qa\n\ndescription\nmore\n##### subtask\ntext")
+
+    restored = markdown.MarkDown()
+    restored.from_compact(md.to_compact())
+    assert restored.to_compact() == md.to_compact()
+    task = restored.nodes[0].nodes[0]
+    assert isinstance(task, markdown.Heading4)
+    assert task.parent is restored.nodes[0]
+    assert task.nodes[0].name == "Responsible"
+    assert isinstance(task.nodes[-1], markdown.Heading5)
+
+
+def test_markdown_cache_persistent(tmpdir):
+    path = tmpdir.join("test.md")
+    path.write(u"# test h1\n#### test task\ndescription")
+    cache_dir = str(tmpdir.join("cache"))
+
+    cold = markdown.MarkDownCache(cache_dir=cache_dir)
+    md = cold.parse(str(path))
+    assert (cold.misses, cold.disk_hits) == (1, 0)
+    assert len(os.listdir(cache_dir)) == 1
+
+    # a new run loads the unchanged file from the disk
+    warm = markdown.MarkDownCache(cache_dir=cache_dir)
+    cached = warm.parse(str(path))
+    assert (warm.misses, warm.disk_hits) == (0, 1)
+    assert cached.to_compact() == md.to_compact()
+
+    # corrupted entry is just parsed again
+    tmpdir.join("cache", os.listdir(cache_dir)[0]).write("garbage")
+    broken = markdown.MarkDownCache(cache_dir=cache_dir)
+    assert broken.parse(str(path)).to_compact() == md.to_compact()
+    assert broken.misses == 1
+
+
+def test_markdown_cache_eviction(tmpdir):
+    cache_dir = str(tmpdir.join("cache"))
+    cache = markdown.MarkDownCache(cache_dir=cache_dir)
+    for i in range(3):
+        path = tmpdir.join("test%d.md" % i)
+        path.write(u"# test h1\n#### task %d\n%s" % (i, "description " * 100))
+        cache.parse(str(path))
+        os.utime(cache.cache_path(cache.content_hash(path.read_binary())), (i, i))
+    sizes = [os.path.getsize(os.path.join(cache_dir, f)) for f in os.listdir(cache_dir)]
+    assert len(sizes) == 3
+
+    cache.max_size = sum(sizes) - 1
+    cache.evict()
+    # least recently used (test0.md) is gone
+    assert not os.path.exists(cache.cache_path(cache.content_hash(tmpdir.join("test0.md").read_binary())))
+    assert len(os.listdir(cache_dir)) == 2
+
+
+def test_heading_levels():
+    levels = markdown.HeadingLevels.get(2, 3, 6)
+    assert levels is markdown.HeadingLevels.get(2, 3, 6)
+    assert levels.role(markdown.Heading3("task")) == markdown.HeadingLevels.TASK
+    assert levels.role(markdown.Heading4("text")) is None
+    assert levels.role(markdown.Paragraph("text")) is None
+    with pytest.raises(ValueError):
+        markdown.HeadingLevels(4, 1, 5)
+
+    tokenizer = markdown.LineTokenizer(levels)
+    assert tokenizer.tokenize("## workflow").kind == markdown.Token.HEADING
+    assert tokenizer.tokenize("# not a heading").kind == markdown.Token.PARAGRAPH
+    # default levels are 1, 4 and 5
+    assert markdown.Heading.is_heading("## not a heading") == 0
+    assert markdown.Heading.is_heading("##### subtask") == 5
+
+
+def test_write_markdown(capsys):
+    md = markdown.MarkDown()
+    md.reads(u"# test h1\n#### task\nResponsible: qa\n\ndescription\n##### subtask\ntext")
+    out = StringIO()
+    md.write_markdown(out)
+    assert out.getvalue() == (
+        "# test h1\n\n#### task\nResponsible: qa\n\n\ndescription\n\n##### subtask\n\ntext\n\n")
+
+    md.print_markdown_tree()
+    assert capsys.readouterr().out == out.getvalue()
+
+
+def test_write_markdown_deep_tree():
+    # same level headings after a paragraph nest, so the tree is as deep as the document
+    md = markdown.MarkDown()
+    md.reads(u"\n".join(["#### task", "text"] * 5000))
+    out = StringIO()
+    md.write_markdown(out)
+    assert out.getvalue() == "#### task\n\ntext\n\n" * 5000
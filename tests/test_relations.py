@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+import configparser
+
+import pytest
+
+import md2workflow.relations as relations
+
+
+ENVIRONMENT = u"""
+[TaskRelations]
+relations = Blocks, Depends On, Implements, Implemented by
+inbound = Implemented by, Depends On
+
+[JiraTaskRelations]
+Blocks = Blocks
+Depends On = Blocks
+Implements = Implements
+Implemented by = Implements
+"""
+
+
+def test_relation_schema():
+    environment = configparser.ConfigParser()
+    environment.read_string(ENVIRONMENT)
+    schema = relations.RelationSchema.from_environment(environment)
+
+    assert schema.names == ["Blocks", "Depends On", "Implements", "Implemented by"]
+    assert schema.is_relation("depends on")
+    assert not schema.is_relation("Responsible")
+    # markdown can use a different case than the config
+    assert schema.is_inbound("Depends on")
+    assert not schema.is_inbound("Blocks")
+    assert schema.link_type("Depends on") == "Blocks"
+    with pytest.raises(ValueError):
+        schema.link_type("Responsible")
+
+
+def test_relation_schema_compiled_once():
+    environment = configparser.ConfigParser()
+    environment.read_string(ENVIRONMENT)
+    schema = relations.RelationSchema.get(environment)
+    assert relations.RelationSchema.get(environment) is schema
+    assert relations.RelationSchema.get(configparser.ConfigParser()) is not schema
+    assert not relations.RelationSchema.get(configparser.ConfigParser()).names
+
+
+class Relation(object):
+    def __init__(self, source, target):
+        self.source = source
+        self.target = target
+
+
+def graph_from_edges(edges):
+    return relations.RelationGraph.from_relations([Relation(s, t) for s, t in edges])
+
+
+def test_relation_graph_waves():
+    graph = graph_from_edges([("a", "b"), ("b", "c"), ("a", "c"), ("d", "c"), ("e", "f")])
+    assert graph.nodes == ["a", "b", "c", "d", "e", "f"]
+    assert graph.waves() == [["a", "d", "e"], ["b", "f"], ["c"]]
+    assert graph.topological_order() == ["a", "d", "e", "b", "f", "c"]
+    assert graph.successors("a") == ["b", "c"]
+    assert graph.predecessors("c") == ["b", "a", "d"]
+    assert graph.find_cycle() is None
+
+
+def test_relation_graph_cycle():
+    graph = graph_from_edges([("a", "b"), ("b", "c"), ("c", "d"), ("d", "b")])
+    assert graph.find_cycle() == ["b", "c", "d", "b"]
+    with pytest.raises(relations.RelationCycleError) as e:
+        graph.waves()
+    assert e.value.cycle == ["b", "c", "d", "b"]
+    assert "b -> c -> d -> b" in str(e.value)
+
+
+def test_relation_graph_transitive_reduction():
+    graph = graph_from_edges([("a", "b"), ("b", "c"), ("a", "c"), ("c", "d"), ("a", "d"), ("b", "d")])
+    assert graph.redundant_edges() == [("a", "c"), ("a", "d"), ("b", "d")]
+    reduced = graph.transitive_reduction()
+    assert reduced.edges == [("a", "b"), ("b", "c"), ("c", "d")]
+    assert reduced.nodes == graph.nodes
+
+
+def test_relation_graph_deep():
+    # no recursion
+    graph = graph_from_edges([(i, i + 1) for i in range(20000)] + [(0, 20000)])
+    assert len(graph.waves()) == 20001
+    assert graph.redundant_edges() == [(0, 20000)]
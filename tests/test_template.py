@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+import configparser
+
+import md2workflow.template as template
+import md2workflow.workflow as workflow
+
+
+def test_template_render():
+    text = u"${Project} ${Product}: ${Epic} ${Milestone} ${Unknown}"
+    compiled = template.Template.get(text)
+    assert compiled is template.Template.get(text)
+    assert compiled.placeholders == set(["Project", "Product", "Epic", "Milestone"])
+    assert compiled.render({"Project": "Leap", "Product": "Leap", "Epic": "Beta", "Milestone": "Beta"}) == \
+        u"Leap Leap: Beta Beta ${Unknown}"
+    # missing values are not substituted
+    assert compiled.render({}) == text
+    assert template.render(u"no placeholders", {"Project": "Leap"}) == u"no placeholders"
+    assert template.render(u"", {}) == u""
+
+
+def test_project_context():
+    conf = configparser.ConfigParser()
+    assert template.project_context(conf) == {}
+
+    conf.read_string(u"[project]\nname = Leap 15.2\n")
+    wf = workflow.GenericWorkflow("Beta")
+    assert template.project_context(conf, wf) == {
+        "Project": "Leap 15.2", "Product": "Leap 15.2", "Epic": "Beta", "Milestone": "Beta"}
+
+
+def test_render_description_memoized():
+    converted = []
+
+    def convert(text, context):
+        converted.append(text)
+        return text.upper()
+
+    task = workflow.GenericTask("task", description=u"Release ${Project}")
+    assert task.render_description({"Project": "Leap"}, convert) == u"RELEASE LEAP"
+    assert task.render_description({"Project": "Leap"}, convert) == u"RELEASE LEAP"
+    assert len(converted) == 1
+
+    task.description = u"Test ${Project}"
+    assert task.render_description({"Project": "Leap"}, convert) == u"TEST LEAP"
+    assert task.render_description({"Project": "SLE"}, convert) == u"TEST SLE"
+    assert len(converted) == 3
@@ -2,6 +2,11 @@
 
 import configparser
 
+try:
+    from io import StringIO
+except ImportError:
+    from StringIO import StringIO
+
 import md2workflow.markdown as markdown
 import md2workflow.workflow as workflow
 
@@ -34,6 +39,27 @@ def test_from_md_empty_task1_task2():
     assert project.tasks[0].tasks[1].description == ""
 
 
+def test_from_md_custom_heading_levels():
+    conf = configparser.ConfigParser()
+    conf.read_string(u"""
+    [project]
+    name = Test Project
+    task_heading_level = 2
+    subtask_heading_level = 3
+    """)
+    project = workflow.GenericProject("Test Project", conf=conf)
+    assert project.heading_levels is markdown.HeadingLevels.get(1, 2, 3)
+
+    md = markdown.MarkDown(project.heading_levels)
+    md.reads("# workflow name\n## task 1\n### subtask 1\n#### just a text\n## task 2")
+    project.from_markdown(md)
+
+    assert len(project.tasks) == 1  # Workflow level task
+    assert [t.summary for t in project.tasks[0].tasks] == ["task 1", "task 2"]
+    assert [t.summary for t in project.tasks[0].tasks[0].tasks] == ["subtask 1"]
+    assert project.tasks[0].tasks[0].tasks[0].description == "#### just a text"
+
+
 def test_from_md_empty_task1_task2_no_h1():
     raw = "#### task 1\n#### task 2"
     md = markdown.MarkDown()
@@ -105,6 +131,47 @@ def test_from_md_task_with_subtask_and_task():
     assert project.tasks[0].tasks[1].description == "description 2"
 
 
+def test_from_md_events():
+    raw = u"# workflow name\n#### task 1\ndescription 1\n##### sub task 1\nsub description\n#### task 2\ndescription 2"
+
+    project = workflow.GenericProject("Test Project")
+    md = markdown.MarkDown()
+    project.from_markdown_events(md.iterparse(StringIO(raw)))
+
+    assert len(project.tasks) == 1
+    assert len(project.tasks[0].tasks) == 2
+    assert project.tasks[0].tasks[0].description == "description 1"
+    assert project.tasks[0].tasks[0].tasks[0].summary == "sub task 1"
+    assert project.tasks[0].tasks[0].tasks[0].description == "sub description"
+    assert project.tasks[0].tasks[1].description == "description 2"
+    assert project.tasks[0].tasks[1]._published
+
+
+def test_workflow_template_shared_by_sections():
+    raw = u"# workflow name\n#### task 1\nResponsible: qa\n\ndescription 1\n##### sub task 1\nsub description"
+    md = markdown.MarkDown()
+    md.reads(raw)
+
+    project = workflow.GenericProject("Test Project")
+    project.from_markdown(md, override_workflow_name="Alpha")
+    project.from_markdown(md, override_workflow_name="Beta")
+
+    assert project.workflow_template(md) is project.workflow_template(md)
+    alpha, beta = project.tasks
+    assert (alpha.summary, beta.summary) == ("Alpha", "Beta")
+    assert alpha.tasks[0] is not beta.tasks[0]
+    assert alpha.tasks[0].tasks[0].parent_task is alpha.tasks[0]
+    assert alpha.tasks[0].description is beta.tasks[0].description
+    assert alpha.tasks[0].variables is beta.tasks[0].variables
+    assert beta.tasks[0].tasks[0].description == "sub description"
+    assert beta.tasks[0].tasks[0]._published
+
+    # variables are copied on write
+    beta.tasks[0].add_variable("Responsible", "dev")
+    assert alpha.tasks[0].variables == {"Responsible": "qa"}
+    assert beta.tasks[0].variables == {"Responsible": "dev"}
+
+
 def test_add_relation_inbound_outbound():
     """
     This test is checking whether following produces exactly one relation
@@ -192,6 +259,102 @@ def test_add_relations():
     assert wf.task_relations[1].target.summary == "Task 3"
 
 
+def test_inbound_relation_from_markdown():
+    environment = configparser.ConfigParser()
+    environment.read_string(u"""
+    [TaskRelations]
+    relations = Blocks, Depends On, Implements, Implemented by
+    inbound = Implemented by, Depends On
+    """)
+    conf = configparser.ConfigParser()
+    conf.read_string(u"""
+    [project]
+    name = Test Project
+    """)
+    md = markdown.MarkDown()
+    md.reads(u"# workflow name\n#### task 1\n#### task 2\nDepends on: task 1")
+
+    project = workflow.GenericProject("Test Project", environment=environment, conf=conf)
+    project.from_markdown(md)
+
+    # 'Depends on' is the inbound 'Depends On' relation, task 1 blocks task 2
+    relation = project.tasks[0].task_relations[0]
+    assert relation.relation_name == "Depends on"
+    assert relation.source.summary == "task 1"
+    assert relation.target.summary == "task 2"
+
+
+def test_relation_adjacency():
+    wf = workflow.GenericWorkflow("Test Workflow")
+    task1 = workflow.GenericTask("Task 1")
+    task2 = workflow.GenericTask("Task 2")
+    task3 = workflow.GenericTask("Task 3")
+    for task in (task1, task2, task3):
+        wf.add_task(task)
+
+    for source, target in ((task1, task2), (task2, task3), (task3, task2)):
+        wf.add_task_relation(workflow.TaskRelation(
+            relation_name="Blocks", parent=wf, source=source, target=target))
+
+    assert len(wf.task_relations) == 2
+    assert wf.find_relation(task3, task2) == [wf.task_relations[1]]
+    assert wf.find_relation(task1, task3) == []
+    assert [r.target for r in wf.task_relations.outbound(task2)] == [task3]
+    assert [r.source for r in wf.task_relations.inbound(task2)] == [task1]
+    assert wf.task_relations.inbound(task1) == []
+
+
+def test_publish_task_relations_transitive_reduction():
+    environment_config = u"""
+    [TaskRelations]
+    relations = Blocks, Depends On, Implements
+    inbound = Depends On
+
+    [JiraTaskRelations]
+    Blocks = Blocks
+    Depends On = Blocks
+    Implements = Implements
+    """
+    environment = configparser.ConfigParser()
+    environment.read_string(environment_config)
+
+    published = []
+
+    class PublishingWorkflow(workflow.GenericWorkflow):
+        def publish_task_relation(self, relation):
+            published.append((relation.source.summary, relation.target.summary))
+
+    wf = PublishingWorkflow("Test Workflow", environment=environment)
+    task_a = workflow.GenericTask("A")
+    task_b = workflow.GenericTask("B")
+    task_c = workflow.GenericTask("C")
+    task_d = workflow.GenericTask("D")
+    for task in (task_a, task_b, task_c, task_d):
+        wf.add_task(task)
+    # A Depends on B, A Depends on C, B Depends on C (inbound), C Blocks D, B Implements D
+    for name, source, target in (("Depends On", task_b, task_a), ("Depends On", task_c, task_a),
+                                 ("Depends On", task_c, task_b), ("Blocks", task_c, task_d),
+                                 ("Implements", task_b, task_d)):
+        wf.add_task_relation(workflow.TaskRelation(
+            relation_name=name, parent=wf, source=source, target=target))
+
+    # C -> A is implied by C -> B -> A (both are Blocks links)
+    # C -> D is not implied as B -> D is an Implements link
+    assert wf.publish_task_relations(transitive_reduction=True) == 1
+    assert published == [("B", "A"), ("C", "B"), ("C", "D"), ("B", "D")]
+
+    del published[:]
+    # disabled by default
+    assert wf.publish_task_relations() == 0
+    assert len(published) == 5
+
+    environment = configparser.ConfigParser()
+    environment.read_string(environment_config)
+    environment["TaskRelations"]["transitive_reduction"] = "true"
+    wf = PublishingWorkflow("Test Workflow", environment=environment)
+    assert wf.relation_schema.transitive_reduction
+
+
 def test_add_relation_from_markdown():
     environment_config = u"""
     [TaskRelations]
@@ -306,6 +469,44 @@ def test_cross_workflow_relations():
     assert len(project.task_relations) == 1
 
 
+def test_get_task_by_summary_scoped_by_workflow(caplog):
+    environment = configparser.ConfigParser()
+    environment.read_string(u"""
+    [TaskRelations]
+    relations = Blocks, Depends On, Implements, Implemented by
+    inbound = Implemented by, Depends On
+    """)
+    conf = configparser.ConfigParser()
+    conf.read_string(u"""
+    [project]
+    name = Test Project
+    """)
+
+    # same file used by multiple milestones
+    raw = u"#### build\n#### test\nDepends on: build\nBlocks: release\n#### release"
+    project = workflow.GenericProject("Test Project", environment=environment, conf=conf)
+    for milestone in ("Alpha 1", "Beta 1"):
+        md = markdown.MarkDown()
+        md.reads(raw)
+        project.from_markdown(md, override_workflow_name=milestone)
+
+    alpha, beta = project.tasks
+    assert len(project.get_tasks_by_summary("build")) == 2
+    assert project.get_tasks_by_summary("Beta 1") == [beta]
+    for wf in (alpha, beta):
+        wf._replace_task_placeholders()
+        assert len(wf.task_relations) == 2
+        for relation in wf.task_relations:
+            assert relation.source.parent_task is wf
+            assert relation.target.parent_task is wf
+
+    # without a workflow the ambiguity is reported and the first task is used
+    assert project.get_task_by_summary("build", from_top=True) is alpha.tasks[0]
+    assert "ambiguous" in caplog.text
+    assert project.get_task_by_summary("build", from_top=True, workflow=beta) is beta.tasks[0]
+    assert beta.tasks[1].get_task_by_summary("Alpha 1", from_top=True) is alpha
+
+
 def test_user_group():
     raw = "# workflow name\n#### task 1\nResponsible: group_a\n#### task 2\nResponsible: group_b"
     md = markdown.MarkDown()
@@ -376,6 +577,54 @@ def test_user_group_nondefault_var():
     assert project.tasks[0].tasks[1].owner == "bar"
 
 
+def test_owner_cached_until_ownership_variable_changes():
+    project_conf = u"""
+    [ownership]
+    markdown_variable = Responsible
+    group_a = foo
+    group_b = bar
+    """
+    conf = configparser.ConfigParser()
+    conf.read_string(project_conf)
+
+    task = workflow.GenericTask("task 1", conf=conf)
+    assert task.owner is None
+    task.add_variable("Responsible", "**Group_A**")
+    assert task.owner == "foo"
+
+    conf["ownership"]["group_a"] = "baz"  # the compiled map is not affected
+    task.add_variable("Responsible", "group_b")
+    assert task.owner == "bar"
+    task.add_variable("Other", "group_a")
+    assert task.owner == "bar"
+
+    task.conf = configparser.ConfigParser()
+    assert task.owner is None
+
+
+def test_ancestors(caplog):
+    project = workflow.GenericProject("Test Project")
+    wf = workflow.GenericWorkflow("Test Workflow")
+    task = workflow.GenericNestedTask("Task")
+    subtask = workflow.GenericTask("Subtask")
+    # attached bottom-up, references are propagated to already attached tasks
+    task.add_task(subtask)
+    wf.add_task(task)
+    project.add_task(wf)
+
+    assert subtask.ancestor("workflow") is wf
+    assert subtask.ancestor("project") is project
+    assert wf.ancestor("workflow") is wf
+    assert project.ancestor("workflow") is None
+    assert subtask.parent_by_subclass(workflow.GenericNestedTask) is task
+    assert subtask.parent_by_subclass(workflow.GenericWorkflow) is wf
+    assert subtask.parent_by_subclass(workflow.GenericProject) is project
+    assert wf.parent_by_subclass(workflow.GenericWorkflow) is wf
+
+    assert workflow.GenericTask("Orphan").parent_by_subclass(workflow.GenericWorkflow) is None
+    assert "Couldn't find parent" in caplog.text
+
+
 def test_get_epic_task():
     raw = "# workflow name\n#### task 1\n#### task 2\n##### subtask 2.1"
     md = markdown.MarkDown()